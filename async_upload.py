@@ -0,0 +1,134 @@
+import os
+import time
+import asyncio
+import logging
+
+from neo4j import AsyncGraphDatabase
+from neo4j.exceptions import Neo4jError
+
+
+def init_async_graph_DB():
+    scheme = "bolt"
+    host_name = "triathlon.itit.gu.se"
+    port = 7688
+    url = "{scheme}://{host_name}:{port}".format(scheme=scheme, host_name=host_name, port=port)
+    user = os.getenv('NEO4JEXTUSER')
+    password = os.getenv('NEO4JEXTPASS')
+
+    driver = AsyncGraphDatabase.driver(url, auth=(user, password))
+
+    return driver
+
+
+async def _write(tx, query, params):
+    result = await tx.run(query, **params)
+    return await result.consume()
+
+
+async def _read_values(tx, query, key, params):
+    result = await tx.run(query, **params)
+    return [record[key] async for record in result]
+
+
+class AsyncUploadEngine:
+    """
+    AsyncUploadEngine runs upload jobs over one async Neo4j driver with several write transactions
+    in flight, so the throughput is not bound by the round trip to the remote host.
+
+    A job is a tuple ``(label, query, params)``, e.g. one chunk built by ``Neo4jUploader``.
+    Jobs are grouped into phases: the jobs of one phase run concurrently, a phase only starts
+    when the previous one finished (edges need the nodes of the phase before).
+
+    :param driver: An active async Neo4j driver instance.
+    :type driver: neo4j.AsyncGraphDatabase.driver
+    :param concurrency: Maximum number of write transactions in flight.
+    :type concurrency: int
+
+    :raises RuntimeError: If a job of a phase failed, later phases are not started.
+
+    **Usage Example**::
+
+        driver = init_async_graph_DB()
+        engine = AsyncUploadEngine(driver, concurrency=8)
+        await engine.run([node_jobs, edge_jobs])
+        await driver.close()
+    """
+    def __init__(self, driver, concurrency: int = 4):
+        self.driver = driver
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def _run_job(self, label, query, params):
+        rows = len(next(iter(params.values()), []))
+        async with self.semaphore:
+            try:
+                # execute_write retries transient errors, e.g. deadlocks between concurrent chunks
+                async with self.driver.session() as session:
+                    summary = await session.execute_write(_write, query, params)
+            except Neo4jError as ne:
+                print(f"Neo4j transaction failed ({label}): {ne.code} – {ne.message}")
+                logging.error(f"Neo4j transaction failed ({label}): {ne.code} – {ne.message}")
+                return False
+            except Exception as e:
+                print(f"Failed to upload {label}\nError: {e}")
+                logging.error(f"Failed to upload {label}\nError: {e}")
+                return False
+
+        counters = summary.counters
+        logging.info(
+            f"[{os.getpid()}] Processed {rows} {label} "
+            f"(nodes created: {counters.nodes_created}, relationships created: {counters.relationships_created})."
+        )
+        return True
+
+    async def run_phase(self, jobs: list):
+        """runs the jobs of one phase concurrently
+
+        :param jobs: ``(label, query, params)`` tuples
+        :type jobs: list
+        :return: number of failed jobs
+        :rtype: int
+        """
+        results = await asyncio.gather(*(self._run_job(*job) for job in jobs))
+        return results.count(False)
+
+    async def run(self, phases: list):
+        """runs the phases one after the other
+
+        :param phases: lists of jobs
+        :type phases: list
+        :return: None
+        """
+        for i, jobs in enumerate(phases):
+            start = time.perf_counter()
+            failed = await self.run_phase(jobs)
+            elapsed = time.perf_counter() - start
+            print(f"[{os.getpid()}] phase {i + 1}/{len(phases)}: {len(jobs)} jobs in {elapsed:.1f}s")
+            logging.info(f"[{os.getpid()}] phase {i + 1}/{len(phases)}: {len(jobs)} jobs, {failed} failed, {elapsed:.1f}s, concurrency {self.concurrency}")
+            if failed:
+                raise RuntimeError(f"{failed} of {len(jobs)} upload jobs failed in phase {i + 1}")
+
+    async def read_values(self, query: str, key: str, param: str, values: list, chunk_size: int):
+        """runs a read query over ``values`` in chunks (concurrently) and collects one column of the result
+
+        :param query: Cypher that takes the chunk as ``$<param>``
+        :type query: str
+        :param key: column of the result to collect
+        :type key: str
+        :param param: name of the query parameter the chunk is passed as
+        :type param: str
+        :param values: values to look up
+        :type values: list
+        :param chunk_size: values per query
+        :type chunk_size: int
+        :return: collected values
+        :rtype: set
+        """
+        async def read_chunk(chunk):
+            async with self.semaphore:
+                async with self.driver.session() as session:
+                    return await session.execute_read(_read_values, query, key, {param: chunk})
+
+        chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+        results = await asyncio.gather(*(read_chunk(chunk) for chunk in chunks))
+        return {value for result in results for value in result}
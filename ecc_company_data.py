@@ -8,8 +8,11 @@ import psycopg2
 import wrds
 
 from neo4j import GraphDatabase
+
+from async_upload import AsyncUploadEngine, init_async_graph_DB
 #%%
-db = wrds.Connection()
+if __name__ == "__main__":
+    db = wrds.Connection()
 
 # PostgreSQL connection settings
 PG_HOST = "localhost"
@@ -91,41 +94,54 @@ get_all_companies_14 = """
                 WHERE rn = 1;
                 """
 #%%
-company_data_long = db.raw_sql(get_all_companies_14)
-company_data_long.dropna(inplace=True)
+def fetch_company_data_wrds(db):
+    company_data_long = db.raw_sql(get_all_companies_14)
+    company_data_long.dropna(inplace=True)
+    return company_data_long
+
+if __name__ == "__main__":
+    company_data_long = fetch_company_data_wrds(db)
 #%% CREATE COMPANY TABLE
-conn = connect_to_postgresql_db()
-cur = conn.cursor()
-cur.execute("""CREATE TABLE company (
-            id SERIAL PRIMARY KEY,
-            companyid INTEGER UNIQUE,
-            companyname TEXT NOT NULL,
-            symbol TEXT,
-            country TEXT,
-            industry TEXT);
-            """)
-conn.commit()
-cur.close()
-conn.close()
+def create_company_table_postgresql():
+    conn = connect_to_postgresql_db()
+    cur = conn.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS company (
+                id SERIAL PRIMARY KEY,
+                companyid INTEGER UNIQUE,
+                companyname TEXT NOT NULL,
+                symbol TEXT,
+                country TEXT,
+                industry TEXT);
+                """)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+if __name__ == "__main__":
+    create_company_table_postgresql()
 #%% INSERT COMPANIES
-conn = connect_to_postgresql_db()
-cur = conn.cursor()
-company_data_long = company_data_long.astype(object).where(pd.notna(company_data_long), None)  # Convert NaNs to None
-company_data_long['companyid'] = company_data_long['companyid'].astype('Int64')
-company_data_long.dropna(inplace=True)
-# Insert unique companies
-unique_companies = company_data_long[['companyid', 'companyname','symbolvalue', 'country', 'industry_sicdescription']].drop_duplicates()
-print(len(unique_companies))
-for _, row in unique_companies.iterrows():
-    cur.execute("""
-    INSERT INTO company (companyid, companyname, symbol, country, industry) 
-    VALUES (%s, %s,%s, %s,%s) 
-    ON CONFLICT (companyid) DO NOTHING;
-    """, (row['companyid'], row['companyname'],row['symbolvalue'],row.get('country', 'Unknown country'), row.get('industry_sicdescription', 'Unkown industry')))
+def insert_company_data_postgresql(company_data_long):
+    conn = connect_to_postgresql_db()
+    cur = conn.cursor()
+    company_data_long = company_data_long.astype(object).where(pd.notna(company_data_long), None)  # Convert NaNs to None
+    company_data_long['companyid'] = company_data_long['companyid'].astype('Int64')
+    company_data_long.dropna(inplace=True)
+    # Insert unique companies
+    unique_companies = company_data_long[['companyid', 'companyname','symbolvalue', 'country', 'industry_sicdescription']].drop_duplicates()
+    print(len(unique_companies))
+    for _, row in unique_companies.iterrows():
+        cur.execute("""
+        INSERT INTO company (companyid, companyname, symbol, country, industry) 
+        VALUES (%s, %s,%s, %s,%s) 
+        ON CONFLICT (companyid) DO NOTHING;
+        """, (row['companyid'], row['companyname'],row['symbolvalue'],row.get('country', 'Unknown country'), row.get('industry_sicdescription', 'Unkown industry')))
+        conn.commit()
     conn.commit()
-conn.commit()
-cur.close()
-conn.close()
+    cur.close()
+    conn.close()
+
+if __name__ == "__main__":
+    insert_company_data_postgresql(company_data_long)
 #%% GET ECC EVENTS
 get_ecc_keydev = """
     SELECT DISTINCT ON (w.companyid, w.keydevid)
@@ -139,13 +155,17 @@ get_ecc_keydev = """
     # WHERE EXTRACT(YEAR FROM w.mostimportantdateutc) = 2020  -- Filter for 2020
     # ;
 #%%
-get_ecc_keydev_df = db.raw_sql(get_ecc_keydev)
+def fetch_ecc_data_wrds(db):
+    return db.raw_sql(get_ecc_keydev)
+
+if __name__ == "__main__":
+    get_ecc_keydev_df = fetch_ecc_data_wrds(db)
 #%%
 def create_ecc_table_postgresql():
     conn = connect_to_postgresql_db()
     cur = conn.cursor()
     
-    cur.execute("""CREATE TABLE ecc (
+    cur.execute("""CREATE TABLE IF NOT EXISTS ecc (
                             id SERIAL PRIMARY KEY
                             ,keydevid BIGINT UNIQUE -- Ensuring uniqueness for FK reference
                             ,companyid INTEGER REFERENCES company(companyid) ON DELETE CASCADE
@@ -160,7 +180,8 @@ def create_ecc_table_postgresql():
     conn.close()
     print("PostgreSQL table created successfully!")
 #%%
-create_ecc_table_postgresql()
+if __name__ == "__main__":
+    create_ecc_table_postgresql()
 #%%
 def insert_ecc_data_postgresql(df):
     if 'companyid' not in df.columns:
@@ -195,14 +216,23 @@ def insert_ecc_data_postgresql(df):
     cur.close()
     conn.close()
 # %%
-insert_ecc_data_postgresql(get_ecc_keydev_df)
+if __name__ == "__main__":
+    insert_ecc_data_postgresql(get_ecc_keydev_df)
 #%%
-driver = init_graph_DB()
+if __name__ == "__main__":
+    driver = init_graph_DB()
+
+# Index statements for the master data, IF NOT EXISTS keeps reruns idempotent
+MASTER_INDEXES = [
+    "CREATE INDEX company_companyid IF NOT EXISTS FOR (c:Company) ON (c.companyid);",
+    "CREATE INDEX ecc_keydevid IF NOT EXISTS FOR (e:ECC) ON (e.keydevid);",
+]
+
 # Function to create indexes in Neo4j
-def create_indexes():
+def create_indexes(driver):
     with driver.session() as session:
-        session.run("CREATE INDEX FOR (c:Company) ON (c.companyid);")
-        session.run("CREATE INDEX FOR (e:ECC) ON (e.keydevid);")
+        for index in MASTER_INDEXES:
+            session.run(index)
         print("✅ Indexes created.")
         # constraints i created manually
 
@@ -214,7 +244,7 @@ def fetch_company_data():
     conn.close()
     return df
 
-def insert_country_and_industry_nodes():
+def insert_country_and_industry_nodes(driver):
     companies = fetch_company_data()
     unique_countries = companies['country'].dropna().unique()
     unique_industries = companies['industry'].dropna().unique()
@@ -232,7 +262,7 @@ def insert_country_and_industry_nodes():
 
     print("✅ Inserted Country and Industry nodes.")
 
-def create_country_industry_relationships():
+def create_country_industry_relationships(driver):
     companies = fetch_company_data()
 
     with driver.session() as session:
@@ -277,7 +307,7 @@ def fetch_ecc_data():
     return df
 
 # Function to insert Company nodes into Neo4j
-def insert_company_data():
+def insert_company_data(driver):
     companies = fetch_company_data()
     with driver.session() as session:
         for _, row in companies.iterrows():
@@ -291,11 +321,11 @@ def insert_company_data():
             companyname=row['companyname'],
             symbol=row['symbol'])
     print(f"✅ Inserted {len(companies)} Company nodes.")
-    insert_country_and_industry_nodes()
-    create_country_industry_relationships()
+    insert_country_and_industry_nodes(driver)
+    create_country_industry_relationships(driver)
 
 # Function to insert ECC nodes into Neo4j
-def insert_ecc_data_neo():
+def insert_ecc_data_neo(driver):
     eccs = fetch_ecc_data()
     with driver.session() as session:
         for _, row in eccs.iterrows():
@@ -319,7 +349,9 @@ def insert_ecc_data_neo():
     print(f"✅ Inserted {len(eccs)} ECC nodes.")
 #%%
 # Function to create relationships (ECC → Company)
-def create_relationships():
+# ecc_count, first_call and last_call on the Company are only touched when the edge is new,
+# so rerunning this keeps the counters correct
+def create_relationships(driver):
     eccs = fetch_ecc_data()
     with driver.session() as session:
         for _, row in eccs.iterrows():
@@ -327,16 +359,138 @@ def create_relationships():
             session.run("""
             MATCH (c:Company {companyid: $companyid})
             MATCH (e:ECC {keydevid: $keydevid})
-            MERGE (c)-[:ARRANGED]->(e);
+            MERGE (c)-[:ARRANGED]->(e)
+            ON CREATE SET
+                c.ecc_count = coalesce(c.ecc_count, 0) + 1,
+                c.first_call = CASE WHEN c.first_call IS NULL OR e.time < c.first_call THEN e.time ELSE c.first_call END,
+                c.last_call = CASE WHEN c.last_call IS NULL OR e.time > c.last_call THEN e.time ELSE c.last_call END;
             """, keydevid=row['keydevid'], companyid=row['companyid'])
     print("✅ Relationships created between ECC and Company.")
+
+# Function to recompute the Company aggregates in bulk (e.g. after ECC times changed)
+def reconcile_company_aggregates(driver):
+    with driver.session() as session:
+        session.run("""
+        MATCH (c:Company)
+        CALL {
+            WITH c
+            OPTIONAL MATCH (c)-[:ARRANGED]->(e:ECC)
+            WITH c, count(e) AS eccs, min(e.time) AS first_call, max(e.time) AS last_call
+            SET c.ecc_count = eccs,
+                c.first_call = first_call,
+                c.last_call = last_call
+        } IN TRANSACTIONS OF 10000 ROWS;
+        """).consume()
+    print("✅ Reconciled Company aggregates.")
+#%%
+# Batched versions of the master graph inserts above for AsyncUploadEngine,
+# every chunk is sent as parallel lists and is its own write transaction
+COMPANY_NODE_QUERY = """
+UNWIND range(0, size($companyid) - 1) AS i
+MERGE (c:Company {companyid: $companyid[i]})
+SET c.name = $companyname[i],
+    c.symbol = $symbol[i]
+"""
+
+COUNTRY_NODE_QUERY = """
+UNWIND $country AS country
+MERGE (:Country {name: country})
+"""
+
+INDUSTRY_NODE_QUERY = """
+UNWIND $industry AS industry
+MERGE (:Industry {name: industry})
+"""
+
+ECC_NODE_QUERY = """
+UNWIND range(0, size($keydevid) - 1) AS i
+MERGE (e:ECC {keydevid: $keydevid[i]})
+SET e.title = $title[i],
+    e.time = $datetime_utc[i],
+    e.quarter = $quarter[i],
+    e.year = $year[i],
+    e.symobl = $symbol[i]
+"""
+
+IN_COUNTRY_QUERY = """
+UNWIND range(0, size($companyid) - 1) AS i
+MATCH (c:Company {companyid: $companyid[i]})
+MATCH (country:Country {name: $country[i]})
+MERGE (c)-[:IN_COUNTRY]->(country)
+"""
+
+IN_INDUSTRY_QUERY = """
+UNWIND range(0, size($companyid) - 1) AS i
+MATCH (c:Company {companyid: $companyid[i]})
+MATCH (industry:Industry {name: $industry[i]})
+MERGE (c)-[:IN_INDUSTRY]->(industry)
+"""
+
+ARRANGED_QUERY = """
+UNWIND range(0, size($keydevid) - 1) AS i
+MATCH (c:Company {companyid: $companyid[i]})
+MATCH (e:ECC {keydevid: $keydevid[i]})
+MERGE (c)-[:ARRANGED]->(e)
+ON CREATE SET
+    c.ecc_count = coalesce(c.ecc_count, 0) + 1,
+    c.first_call = CASE WHEN c.first_call IS NULL OR e.time < c.first_call THEN e.time ELSE c.first_call END,
+    c.last_call = CASE WHEN c.last_call IS NULL OR e.time > c.last_call THEN e.time ELSE c.last_call END
+"""
+
+def dataframe_jobs(label, query, df, chunk_size):
+    return [
+        (label, query, {column: df[column].iloc[i:i + chunk_size].tolist() for column in df.columns})
+        for i in range(0, len(df), chunk_size)
+    ]
+
+# like dataframe_jobs(), but the rows of one `key` value are never split over two chunks
+# - within a phase every Company is then written by a single transaction
+def partitioned_dataframe_jobs(label, query, df, key, chunk_size):
+    chunks, chunk, rows = [], [], 0
+    for _, group in df.groupby(key, sort=True):
+        if chunk and rows + len(group) > chunk_size:
+            chunks.append(pd.concat(chunk))
+            chunk, rows = [], 0
+        chunk.append(group)
+        rows += len(group)
+    if chunk:
+        chunks.append(pd.concat(chunk))
+    return [(label, query, {column: part[column].tolist() for column in part.columns}) for part in chunks]
+
+# Function to insert Company, Country, Industry and ECC nodes and their edges with several transactions in flight
+async def insert_master_graph_async(concurrency=4, chunk_size=2000):
+    companies = fetch_company_data()
+    eccs = fetch_ecc_data().dropna(subset=['keydevid'])
+
+    # every relationship type is its own phase, all of them lock the Company nodes
+    # - rows sorted by the shared end node (Country/Industry), every transaction locks those in the same order
+    # - ECCs of one company end up in the same chunk, no two transactions update the same Company counters
+    countries = companies[['companyid', 'country']].dropna().sort_values(['country', 'companyid'])
+    industries = companies[['companyid', 'industry']].dropna().sort_values(['industry', 'companyid'])
+    phases = [
+        dataframe_jobs('company-nodes', COMPANY_NODE_QUERY, companies[['companyid', 'companyname', 'symbol']], chunk_size)
+        + dataframe_jobs('country-nodes', COUNTRY_NODE_QUERY, countries[['country']].drop_duplicates(), chunk_size)
+        + dataframe_jobs('industry-nodes', INDUSTRY_NODE_QUERY, industries[['industry']].drop_duplicates(), chunk_size)
+        + dataframe_jobs('ecc-nodes', ECC_NODE_QUERY, eccs[['keydevid', 'title', 'datetime_utc', 'quarter', 'year', 'symbol']], chunk_size),
+        dataframe_jobs('company-countries', IN_COUNTRY_QUERY, countries, chunk_size),
+        dataframe_jobs('company-industries', IN_INDUSTRY_QUERY, industries, chunk_size),
+        partitioned_dataframe_jobs('company-eccs', ARRANGED_QUERY, eccs[['companyid', 'keydevid']], 'companyid', chunk_size),
+    ]
+
+    driver = init_async_graph_DB()
+    try:
+        await AsyncUploadEngine(driver, concurrency=concurrency).run(phases)
+    finally:
+        await driver.close()
+    print(f"✅ Inserted {len(companies)} Company and {len(eccs)} ECC nodes with relationships.")
 #%%
-create_indexes()
-insert_company_data()
-insert_ecc_data_neo()
-create_relationships()  
+if __name__ == "__main__":
+    create_indexes(driver)
+    insert_company_data(driver)
+    insert_ecc_data_neo(driver)
+    create_relationships(driver)
 
-# Close Neo4j connection
-driver.close()
+    # Close Neo4j connection
+    driver.close()
 
 # %%
@@ -0,0 +1,239 @@
+import logging
+
+# indexes the query API below relies on, provision_search_indexes() keeps the database in line with these
+SEARCH_INDEXES = {
+    # covers Statement.text (inline text storage) and Text.text (shared text storage)
+    "statement_text": {
+        "type": "FULLTEXT",
+        "labels": ["Statement", "Text"],
+        "properties": ["text", "name"],
+        "create": "CREATE FULLTEXT INDEX statement_text IF NOT EXISTS FOR (n:Statement|Text) ON EACH [n.text, n.name]",
+    },
+    # a composite index is only used with a predicate on all of its properties, a year-only lookup needs its own
+    "ecc_year": {
+        "type": "RANGE",
+        "labels": ["ECC"],
+        "properties": ["year"],
+        "create": "CREATE INDEX ecc_year IF NOT EXISTS FOR (e:ECC) ON (e.year)",
+    },
+    "ecc_year_quarter": {
+        "type": "RANGE",
+        "labels": ["ECC"],
+        "properties": ["year", "quarter"],
+        "create": "CREATE INDEX ecc_year_quarter IF NOT EXISTS FOR (e:ECC) ON (e.year, e.quarter)",
+    },
+    "participant_name": {
+        "type": "RANGE",
+        "labels": ["Participant"],
+        "properties": ["name"],
+        "create": "CREATE INDEX participant_name IF NOT EXISTS FOR (p:Participant) ON (p.name)",
+    },
+}
+
+
+def provision_search_indexes(driver, timeout: int = 600):
+    """this function creates the indexes in ``SEARCH_INDEXES`` and recreates any index with
+    the same name whose definition drifted (other labels, properties or type)
+    - waits until all indexes are online, populating a new full-text index over all
+      Statements can take a while
+
+    :param driver: An active Neo4j driver instance
+    :type driver: neo4j.GraphDatabase.driver
+    :param timeout: seconds to wait for the indexes to come online
+    :type timeout: int
+    :return: None
+    """
+    with driver.session() as session:
+        existing = {
+            record["name"]: record
+            for record in session.run("SHOW INDEXES YIELD name, type, labelsOrTypes, properties")
+        }
+        for name, spec in SEARCH_INDEXES.items():
+            index = existing.get(name)
+            if index is not None and (
+                index["type"] != spec["type"]
+                or index["labelsOrTypes"] != spec["labels"]
+                or index["properties"] != spec["properties"]
+            ):
+                print(f"index {name} is out of date, recreating it")
+                logging.info(f"index {name} is out of date, recreating it")
+                session.run(f"DROP INDEX {name} IF EXISTS").consume()
+            session.run(spec["create"]).consume()
+
+        session.run("CALL db.awaitIndexes($timeout)", timeout=timeout).consume()
+    print("✅ Search indexes provisioned.")
+
+
+class GraphQueries:
+    """
+    GraphQueries bundles the lookups that are backed by the indexes in ``SEARCH_INDEXES``.
+
+    :param driver: An active Neo4j driver instance.
+    :type driver: neo4j.GraphDatabase.driver
+
+    .. method:: search_statements(text, year=None, quarter=None, limit=25, max_candidates=10000)
+
+        Full-text search over Statement text and speaker name (Lucene syntax, e.g. ``"safe harbor"``),
+        optionally restricted to the ECCs of one year/quarter (looks at up to ``max_candidates`` index hits). A hit on a shared Text node
+        returns the Statements that use the text, at most ``limit`` of them.
+
+    .. method:: eccs_in_period(year, quarter=None)
+
+        ECCs of one year via the range index on ``ECC(year)``, of one quarter via ``ECC(year, quarter)``.
+
+    .. method:: participants_by_name(name, limit=25)
+
+        Participants whose name starts with ``name`` via the range index on ``Participant(name)``.
+
+    .. method:: transcript(keydevid)
+
+        Statements of one ECC in reading order, walked from ``FIRST_STATEMENT`` along ``NEXT``.
+
+    **Usage Example**::
+
+        queries = GraphQueries(driver)
+        queries.search_statements('"supply chain"', year=2021, quarter=3)
+    """
+    def __init__(self, driver):
+        self.driver = driver
+
+    def _read(self, query, **params):
+        with self.driver.session() as session:
+            return session.execute_read(lambda tx: tx.run(query, **params).data())
+
+    def search_statements(self, text: str, year: int = None, quarter: int = None, limit: int = 25, max_candidates: int = 10000):
+        """full-text search over the statements, best matches first
+        - the full-text index cannot filter by ECC, so its hits are pulled page by page (each page
+          twice the size of the last) until ``limit`` statements passed the year/quarter filter or
+          the index has no more hits
+        - at most ``max_candidates`` hits are looked at, a rare query in a period with few matches
+          can come back with fewer than ``limit`` statements (logged as a warning)
+
+        :param text: Lucene query string
+        :type text: str
+        :param year: only statements of ECCs in this year
+        :type year: int
+        :param quarter: only statements of ECCs in this quarter
+        :type quarter: int
+        :param limit: maximum number of statements returned
+        :type limit: int
+        :param max_candidates: maximum number of index hits looked at
+        :type max_candidates: int
+        :return: statements with score and their ECC, each statement once
+        :rtype: list
+        """
+        page = limit if year is None and quarter is None else limit * 20
+        statements, seen, skip = [], set(), 0
+        while len(statements) < limit and skip < max_candidates:
+            page = min(page, max_candidates - skip)
+            hits = self._read("""
+                CALL db.index.fulltext.queryNodes("statement_text", $text, {skip: $skip, limit: $page})
+                YIELD node, score
+                // a shared Text can be used by thousands of Statements, each hit is expanded
+                // (and filtered) on its own and stops after $limit Statements
+                CALL {
+                    WITH node
+                    MATCH (s:Statement)-[:HAS_TEXT*0..1]->(node)
+                    MATCH (s)-[:WAS_GIVEN_AT]->(e:ECC)
+                    WHERE ($year IS NULL OR e.year = $year)
+                      AND ($quarter IS NULL OR e.quarter = $quarter)
+                    WITH s, e
+                    LIMIT $limit
+                    // a hit on the speaker name of a shared-storage Statement has no text of its own
+                    OPTIONAL MATCH (s)-[:HAS_TEXT]->(t:Text)
+                    RETURN collect({
+                        c_transcriptcomponentid: s.c_transcriptcomponentid,
+                        name: s.name,
+                        text: coalesce(s.text, t.text),
+                        order: s.order,
+                        keydevid: e.keydevid,
+                        title: e.title,
+                        year: e.year,
+                        quarter: e.quarter
+                    }) AS matches
+                }
+                RETURN score, matches
+                ORDER BY score DESC
+                """, text=text, year=year, quarter=quarter, skip=skip, page=page, limit=limit)
+
+            # a Statement whose name and shared Text both match is found twice, the better hit comes first
+            for hit in hits:
+                for match in hit["matches"]:
+                    if match["c_transcriptcomponentid"] not in seen:
+                        seen.add(match["c_transcriptcomponentid"])
+                        statements.append({**match, "score": hit["score"]})
+            # every hit returns a row (with empty matches if filtered out), fewer rows than asked means the index is exhausted
+            if len(hits) < page:
+                break
+            skip += page
+            page *= 2
+
+        if len(statements) < limit and skip >= max_candidates:
+            logging.warning(f"search_statements({text!r}, year={year}, quarter={quarter}) stopped after {max_candidates} index hits with {len(statements)} statements")
+        return statements[:limit]
+
+    def eccs_in_period(self, year: int, quarter: int = None):
+        """ECCs of one year, or of one quarter of that year
+
+        :param year: year of the ECCs
+        :type year: int
+        :param quarter: quarter of the ECCs, all quarters if None
+        :type quarter: int
+        :return: ECCs with their precomputed counters
+        :rtype: list
+        """
+        # the quarter predicate is only added when given, an "OR IS NULL" would keep it out of the index seek
+        # - with it the seek goes through ecc_year_quarter, without it through ecc_year
+        quarter_filter = "AND e.quarter = $quarter" if quarter is not None else ""
+        return self._read(f"""
+            MATCH (e:ECC)
+            WHERE e.year = $year {quarter_filter}
+            RETURN e.keydevid AS keydevid,
+                   e.title AS title,
+                   e.time AS time,
+                   e.year AS year,
+                   e.quarter AS quarter,
+                   e.statement_count AS statement_count,
+                   e.participant_count AS participant_count
+            ORDER BY e.time
+            """, year=year, quarter=quarter)
+
+    def participants_by_name(self, name: str, limit: int = 25):
+        """participants whose name starts with the given string
+
+        :param name: beginning of the participant name (case sensitive)
+        :type name: str
+        :param limit: maximum number of participants returned
+        :type limit: int
+        :return: participants
+        :rtype: list
+        """
+        return self._read("""
+            MATCH (p:Participant)
+            WHERE p.name STARTS WITH $name
+            RETURN p.c_transcriptpersonid AS c_transcriptpersonid,
+                   p.name AS name,
+                   p.description AS description
+            ORDER BY p.name
+            LIMIT $limit
+            """, name=name, limit=limit)
+
+    def transcript(self, keydevid: int):
+        """statements of one ECC in reading order, without sorting on the client
+
+        :param keydevid: ECC to read
+        :type keydevid: int
+        :return: statements in c_componentorder order
+        :rtype: list
+        """
+        return self._read("""
+            MATCH (e:ECC {keydevid: $keydevid})-[:FIRST_STATEMENT]->(first:Statement)
+            MATCH (e)-[:LAST_STATEMENT]->(last:Statement)
+            MATCH path = (first)-[:NEXT*0..]->(last)
+            UNWIND nodes(path) AS s
+            OPTIONAL MATCH (s)-[:HAS_TEXT]->(t:Text)
+            RETURN s.c_transcriptcomponentid AS c_transcriptcomponentid,
+                   s.order AS order,
+                   s.name AS name,
+                   coalesce(s.text, t.text) AS text
+            """, keydevid=keydevid)
@@ -0,0 +1,464 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import argparse
+from datetime import datetime
+from dataclasses import dataclass, field, asdict
+from multiprocessing import Pool
+from typing import Callable
+
+import pandas as pd
+
+import ecc_company_data as master
+import statement_participant_data as transcripts
+import graph_queries
+
+BASE_PATH = "/Users/joey/Desktop/uni/Master/graph_builder/"
+STATE_PATH = os.path.join(BASE_PATH, "logs", "pipeline_state.json")
+
+# bump this when the Statement/Participant upload changes what ends up in the graph,
+# every company is then treated as stale on the next run
+# - not bumped for additions that `reconcile` backfills in bulk: the ECC/Company counters and the
+#   NEXT chain with FIRST/LAST pointers; a reload would not fill the counters anyway, they are only
+#   counted when an edge is created (see "Upgrading an existing graph" in the README)
+TRANSCRIPTS_LOADER_VERSION = 1
+
+
+@dataclass
+class PipelineConfig:
+    """
+    PipelineConfig holds the tunables of a pipeline run.
+    Values can be read from a JSON file (``--config``) and overridden on the command line.
+
+    :ivar workers: Number of processes fetching and uploading companies in the transcripts stage.
+    :ivar chunk_size: Number of rows sent per UNWIND statement to Neo4j.
+    :ivar window_size: Maximum number of transcripts of one company fetched and uploaded at once.
+    :ivar text_storage: ``inline`` text on every Statement, or ``shared`` Text nodes keyed by content hash.
+    :ivar concurrency: Write transactions in flight per process, above 1 uploads go through AsyncUploadEngine.
+    :ivar state_path: Path of the JSON file the stage fingerprints are recorded in.
+    """
+    workers: int = 1
+    chunk_size: int = 2000
+    window_size: int = 200
+    text_storage: str = "inline"
+    concurrency: int = 1
+    state_path: str = STATE_PATH
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+
+@dataclass
+class Stage:
+    """
+    Stage is one step of the pipeline with declared inputs and outputs.
+
+    :ivar name: Name of the stage, used on the command line and in the state file.
+    :ivar inputs: Returns a JSON-serialisable description of everything the stage reads,
+        the stage is skipped when its fingerprint matches the recorded one.
+    :ivar run: Executes the stage, returning False leaves the stage stale for the next run.
+    :ivar outputs: What the stage writes, informational only.
+    :ivar depends_on: Stages whose fingerprints feed into this stage's fingerprint.
+    """
+    name: str
+    inputs: Callable
+    run: Callable
+    outputs: tuple
+    depends_on: tuple = field(default_factory=tuple)
+
+
+def fingerprint(value) -> str:
+    """hashes a JSON-serialisable value into a stable hex digest
+
+    :param value: inputs of a stage (or of one company)
+    :return: sha256 hex digest
+    :rtype: str
+    """
+    payload = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PipelineState:
+    """
+    PipelineState persists the fingerprints of completed stages (and of the companies
+    processed in the transcripts stage) to a local JSON file.
+
+    :param path: Location of the state file.
+    :type path: str
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.state = {"stages": {}, "companies": {}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.state.update(json.load(f))
+
+    def stage(self, name):
+        return self.state["stages"].get(name, {}).get("fingerprint")
+
+    def record_stage(self, name, stage_fingerprint):
+        self.state["stages"][name] = {
+            "fingerprint": stage_fingerprint,
+            "completed_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.save()
+
+    def company(self, companyid):
+        return self.state["companies"].get(str(companyid))
+
+    def record_company(self, companyid, company_fingerprint):
+        self.state["companies"][str(companyid)] = company_fingerprint
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        # replace keeps the old state intact if the process dies while writing
+        os.replace(tmp_path, self.path)
+
+
+class PipelineContext:
+    """
+    PipelineContext lazily opens the connections the stages need and shares
+    them for the length of one run.
+
+    :param config: Configuration of this run.
+    :type config: PipelineConfig
+    """
+    def __init__(self, config: PipelineConfig):
+        self.config = config
+        self._wrds_db = None
+        self._driver = None
+
+    @property
+    def wrds_db(self):
+        if self._wrds_db is None:
+            self._wrds_db = transcripts.get_wrds_connection()
+        return self._wrds_db
+
+    @property
+    def driver(self):
+        if self._driver is None:
+            self._driver = master.init_graph_DB()
+        return self._driver
+
+    def pg_query(self, query):
+        conn = master.connect_to_postgresql_db()
+        try:
+            return pd.read_sql(query, conn)
+        finally:
+            conn.close()
+
+    def close(self):
+        if self._driver is not None:
+            self._driver.close()
+        if self._wrds_db is not None:
+            self._wrds_db.close()
+
+# cheap probes on the WRDS side, if these do not move the fetched tables would not either
+WRDS_COMPANY_PROBE = """
+    SELECT COUNT(DISTINCT companyid) AS companies, MAX(mostimportantdateutc) AS last_date
+    FROM ciq_transcripts.wrds_transcript_detail
+    WHERE mostimportantdateutc > '2014-01-01';
+    """
+
+WRDS_ECC_PROBE = """
+    SELECT COUNT(DISTINCT keydevid) AS eccs, MAX(mostimportantdateutc) AS last_date
+    FROM ciq_transcripts.wrds_transcript_detail
+    WHERE mostimportantdateutc >= '2014-01-01';
+    """
+
+# per company probe for the transcripts stage, a new or replaced transcript changes the row
+WRDS_TRANSCRIPT_PROBE = """
+    SELECT companyid, COUNT(DISTINCT transcriptid) AS transcripts, MAX(transcriptid) AS last_transcriptid
+    FROM ciq_transcripts.wrds_transcript_detail
+    WHERE mostimportantdateutc >= '2014-01-01'
+    GROUP BY companyid;
+    """
+
+# snapshots of the local PostgreSQL masterdata that is pushed to Neo4j
+PG_COMPANY_SNAPSHOT = """
+    SELECT COUNT(*) AS companies,
+        md5(string_agg(companyid || '|' || companyname || '|' || COALESCE(symbol, '') || '|'
+            || COALESCE(country, '') || '|' || COALESCE(industry, ''), ',' ORDER BY companyid)) AS digest
+    FROM company;
+    """
+
+PG_ECC_SNAPSHOT = """
+    SELECT COUNT(*) AS eccs,
+        md5(string_agg(keydevid || '|' || companyid || '|' || title || '|'
+            || COALESCE(datetime_utc::text, ''), ',' ORDER BY keydevid)) AS digest
+    FROM ecc;
+    """
+
+
+def records(df: pd.DataFrame):
+    return json.loads(df.to_json(orient="records", date_format="iso"))
+
+# ---- company_table
+def company_table_inputs(ctx):
+    return {"query": master.get_all_companies_14, "wrds": records(ctx.wrds_db.raw_sql(WRDS_COMPANY_PROBE))}
+
+def run_company_table(ctx, state):
+    master.create_company_table_postgresql()
+    master.insert_company_data_postgresql(master.fetch_company_data_wrds(ctx.wrds_db))
+
+# ---- ecc_table
+def ecc_table_inputs(ctx):
+    return {"query": master.get_ecc_keydev, "wrds": records(ctx.wrds_db.raw_sql(WRDS_ECC_PROBE))}
+
+def run_ecc_table(ctx, state):
+    master.create_ecc_table_postgresql()
+    master.insert_ecc_data_postgresql(master.fetch_ecc_data_wrds(ctx.wrds_db))
+
+# ---- indexes
+def indexes_inputs(ctx):
+    return {
+        "indexes": master.MASTER_INDEXES,
+        "constraints": transcripts.STATEMENT_CONSTRAINTS,
+        "search_indexes": graph_queries.SEARCH_INDEXES,
+    }
+
+def run_indexes(ctx, state):
+    master.create_indexes(ctx.driver)
+    transcripts.create_constraints(ctx.driver)
+    graph_queries.provision_search_indexes(ctx.driver)
+
+# ---- master_graph
+def master_graph_inputs(ctx):
+    return {
+        "company": records(ctx.pg_query(PG_COMPANY_SNAPSHOT)),
+        "ecc": records(ctx.pg_query(PG_ECC_SNAPSHOT)),
+    }
+
+def run_master_graph(ctx, state):
+    if ctx.config.concurrency > 1:
+        asyncio.run(master.insert_master_graph_async(ctx.config.concurrency, ctx.config.chunk_size))
+        return
+    master.insert_company_data(ctx.driver)
+    master.insert_ecc_data_neo(ctx.driver)
+    master.create_relationships(ctx.driver)
+
+# ---- transcripts
+def company_fingerprints(ctx):
+    """fingerprints every company in the local company table against the WRDS transcript probe
+
+    :return: companyid -> fingerprint, companies without transcripts are left out
+    :rtype: dict
+    """
+    companies = ctx.pg_query("SELECT companyid FROM company ORDER BY companyid;")
+    probe = ctx.wrds_db.raw_sql(WRDS_TRANSCRIPT_PROBE)
+    probe = probe[probe["companyid"].isin(companies["companyid"])]
+    return {
+        int(row["companyid"]): fingerprint({
+            "transcripts": int(row["transcripts"]),
+            "last_transcriptid": int(row["last_transcriptid"]),
+            "loader_version": TRANSCRIPTS_LOADER_VERSION,
+            "text_storage": ctx.config.text_storage,
+        })
+        for _, row in probe.iterrows()
+    }
+
+def transcripts_inputs(ctx):
+    ctx.company_fingerprints = company_fingerprints(ctx)
+    return {"companies": ctx.company_fingerprints}
+
+# every worker process keeps its own WRDS connection for all the companies it handles
+_worker_wrds_db = None
+
+def _init_worker():
+    global _worker_wrds_db
+    _worker_wrds_db = transcripts.get_wrds_connection()
+
+def _process_company_worker(args):
+    row, config = args
+    companyid = row["companyid"]
+    ok = transcripts.process_company(
+        row, _worker_wrds_db, batch_name=f"batch_{companyid}",
+        chunk_size=config.chunk_size, window_size=config.window_size,
+        text_storage=config.text_storage, concurrency=config.concurrency,
+    )
+    return companyid, ok
+
+def run_transcripts(ctx, state):
+    company_fps = ctx.company_fingerprints
+    stale = [cid for cid, fp in company_fps.items() if state.company(cid) != fp]
+    print(f"transcripts: {len(stale)} of {len(company_fps)} companies are stale")
+    logging.info(f"transcripts: {len(stale)} of {len(company_fps)} companies are stale")
+    if not stale:
+        return True
+
+    companies = ctx.pg_query("SELECT companyid, companyname FROM company ORDER BY companyid;")
+    companies = companies[companies["companyid"].isin(stale)]
+    jobs = [(row, ctx.config) for _, row in companies.iterrows()]
+
+    failed = 0
+    def record(companyid, ok):
+        nonlocal failed
+        if ok:
+            state.record_company(companyid, company_fps[int(companyid)])
+        else:
+            failed += 1
+
+    if ctx.config.workers > 1:
+        with Pool(ctx.config.workers, initializer=_init_worker) as pool:
+            for companyid, ok in pool.imap_unordered(_process_company_worker, jobs):
+                record(companyid, ok)
+    else:
+        for row, config in jobs:
+            ok = transcripts.process_company(
+                row, ctx.wrds_db, chunk_size=config.chunk_size, window_size=config.window_size,
+                text_storage=config.text_storage, concurrency=config.concurrency,
+            )
+            record(row["companyid"], ok)
+
+    if failed:
+        print(f"⚠️ {failed} companies failed, they stay stale and are retried on the next run")
+    return failed == 0
+
+
+STAGES = [
+    Stage("company_table", company_table_inputs, run_company_table,
+          outputs=("postgres:company",)),
+    Stage("ecc_table", ecc_table_inputs, run_ecc_table,
+          outputs=("postgres:ecc",), depends_on=("company_table",)),
+    Stage("indexes", indexes_inputs, run_indexes,
+          outputs=("neo4j:indexes",)),
+    Stage("master_graph", master_graph_inputs, run_master_graph,
+          outputs=("neo4j:Company", "neo4j:ECC", "neo4j:Country", "neo4j:Industry"),
+          depends_on=("ecc_table", "indexes")),
+    Stage("transcripts", transcripts_inputs, run_transcripts,
+          outputs=("neo4j:Statement", "neo4j:Participant"),
+          depends_on=("master_graph",)),
+]
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+def stage_fingerprint(stage, ctx, state):
+    upstream = {name: state.stage(name) for name in stage.depends_on}
+    return fingerprint({"inputs": stage.inputs(ctx), "upstream": upstream})
+
+
+def run_pipeline(config: PipelineConfig, only=None, force=False, dry_run=False):
+    """runs the stages in order and skips every stage whose fingerprint is unchanged
+
+    :param config: configuration of this run
+    :type config: PipelineConfig
+    :param only: names of the stages to consider, all stages when None
+    :type only: list
+    :param force: run the selected stages even if they are up to date
+    :type force: bool
+    :param dry_run: only report which stages are stale, a stage downstream of a stale stage
+        is reported stale too (a real run would record a new upstream fingerprint first)
+    :type dry_run: bool
+    """
+    state = PipelineState(config.state_path)
+    ctx = PipelineContext(config)
+    stale = set()
+    try:
+        for stage in STAGES:
+            if only and stage.name not in only:
+                continue
+            stale_upstream = [name for name in stage.depends_on if name in stale]
+            if dry_run and stale_upstream:
+                stale.add(stage.name)
+                print(f"🔁 {stage.name}: stale (upstream {', '.join(stale_upstream)} is stale)")
+                continue
+            stage_fp = stage_fingerprint(stage, ctx, state)
+            if not force and state.stage(stage.name) == stage_fp:
+                print(f"⏭️  {stage.name}: up to date")
+                logging.info(f"pipeline stage {stage.name} up to date")
+                continue
+            if dry_run:
+                stale.add(stage.name)
+                print(f"🔁 {stage.name}: stale")
+                continue
+
+            print(f"▶️  {stage.name}: running")
+            logging.info(f"pipeline stage {stage.name} running")
+            if force and stage.name == "transcripts":
+                state.state["companies"] = {}
+            completed = stage.run(ctx, state) is not False
+
+            if completed:
+                state.record_stage(stage.name, stage_fp)
+                print(f"✅ {stage.name}: done")
+                logging.info(f"pipeline stage {stage.name} done")
+            else:
+                logging.warning(f"pipeline stage {stage.name} incomplete, stays stale")
+    finally:
+        ctx.close()
+
+
+def show_status(config: PipelineConfig):
+    state = PipelineState(config.state_path)
+    for stage in STAGES:
+        recorded = state.state["stages"].get(stage.name)
+        completed = recorded["completed_at"] if recorded else "never"
+        print(f"{stage.name:<15} last completed: {completed}")
+    print(f"{'companies':<15} processed: {len(state.state['companies'])}")
+
+
+def reconcile(config: PipelineConfig):
+    """recomputes the counters that the loaders maintain incrementally and backfills missing statement chains"""
+    ctx = PipelineContext(config)
+    try:
+        master.reconcile_company_aggregates(ctx.driver)
+        transcripts.reconcile_ecc_aggregates(ctx.driver)
+        transcripts.link_statement_chains(ctx.driver)
+    finally:
+        ctx.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Build the ECC graph stage by stage.")
+    parser.add_argument("--config", help="JSON file with PipelineConfig values")
+    parser.add_argument("--workers", type=int, help="processes for the transcripts stage")
+    parser.add_argument("--chunk-size", type=int, help="rows per UNWIND statement")
+    parser.add_argument("--window-size", type=int, help="transcripts per fetch window of one company")
+    parser.add_argument("--concurrency", type=int, help="write transactions in flight per process")
+    parser.add_argument("--text-storage", choices=["inline", "shared"],
+                        help="store statement text on every Statement or once per distinct text")
+    parser.add_argument("--state-path", help="location of the fingerprint state file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run all stale stages")
+    run.add_argument("stages", nargs="*",
+                     help=f"restrict the run to these stages: {', '.join(STAGES_BY_NAME)}")
+    run.add_argument("--force", action="store_true", help="rerun the stages even if up to date")
+    run.add_argument("--dry-run", action="store_true", help="only report which stages are stale")
+
+    sub.add_parser("status", help="show when each stage last completed")
+    sub.add_parser("reconcile", help="recompute the aggregate properties on ECC and Company nodes, backfill NEXT chains")
+    return parser
+
+
+def config_from_args(args):
+    config = PipelineConfig.from_file(args.config) if args.config else PipelineConfig()
+    for key, value in vars(args).items():
+        if value is not None and hasattr(config, key):
+            setattr(config, key, value)
+    return config
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    unknown = set(getattr(args, "stages", [])) - set(STAGES_BY_NAME)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    config = config_from_args(args)
+    logging.info(f"pipeline config: {asdict(config)}")
+
+    if args.command == "run":
+        run_pipeline(config, only=args.stages, force=args.force, dry_run=args.dry_run)
+    elif args.command == "status":
+        show_status(config)
+    elif args.command == "reconcile":
+        reconcile(config)
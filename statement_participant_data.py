@@ -3,6 +3,8 @@ from dotenv import load_dotenv
 load_dotenv(dotenv_path="/Users/joey/Desktop/uni/Master/graph_builder/.env")
 
 import json
+import asyncio
+import hashlib
 import logging
 import psycopg2
 from datetime import datetime
@@ -14,6 +16,8 @@ import wrds
 from neo4j import GraphDatabase
 from neo4j.exceptions import ConstraintError, Neo4jError
 
+from async_upload import AsyncUploadEngine, init_async_graph_DB
+
 
 def get_wrds_connection():
     try:
@@ -38,6 +42,9 @@ logging.basicConfig(
     format="%(asctime)s — %(levelname)s — %(message)s"
 )
 
+# local JSON files WRDSFetcher writes and Neo4jUploader reads
+IMPORT_PATH = os.path.expanduser("/Users/joey/Desktop/uni/Master/graph_builder/local_int/")
+
 # PostgreSQL connection settings
 PG_HOST = "localhost"
 PG_PORT = "5432"
@@ -68,6 +75,82 @@ def init_graph_DB():
 
     return driver
 
+class NoDataError(Exception):
+    """raised by WRDSFetcher when WRDS has no transcripts for the company (or one window of it),
+    the only error process_company() treats as "nothing to load" instead of a failure"""
+
+# uniqueness constraints the MERGE statements of Neo4jUploader look their nodes up by
+STATEMENT_CONSTRAINTS = [
+    "CREATE CONSTRAINT c_transcriptcomponentid_unique IF NOT EXISTS FOR (s:Statement) REQUIRE s.c_transcriptcomponentid IS UNIQUE",
+    "CREATE CONSTRAINT c_transcriptpersonid_unique IF NOT EXISTS FOR (p:Participant) REQUIRE p.c_transcriptpersonid IS UNIQUE",
+    "CREATE CONSTRAINT text_hash_unique IF NOT EXISTS FOR (t:Text) REQUIRE t.hash IS UNIQUE",
+]
+
+def create_constraints(driver):
+    with driver.session() as session:
+        for constraint in STATEMENT_CONSTRAINTS:
+            session.run(constraint).consume()
+    print("✅ Statement constraints created.")
+
+def text_hash(text: str) -> str:
+    """content hash a statement text is stored under in the ``shared`` text storage mode
+
+    :param text: componenttext of a statement
+    :type text: str
+    :return: sha1 hex digest of the utf-8 encoded text
+    :rtype: str
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def to_columns(rows: list, columns: dict) -> dict:
+    """projects rows onto the columns a query uses and transposes them into parallel lists,
+    so every key is sent once per batch instead of once per row and values arrive already typed
+
+    :param rows: records as loaded from the local JSON files
+    :type rows: list
+    :param columns: column name -> type the values are coerced to (None stays None)
+    :type columns: dict
+    :return: column name -> list of values, all lists in row order
+    :rtype: dict
+    """
+    return {
+        column: [None if row.get(column) is None else cast(row[column]) for row in rows]
+        for column, cast in columns.items()
+    }
+
+def read_json_lines(path: str) -> list:
+    """reads a JSON lines file written by ``DataFrame.to_json(orient="records", lines=True)``
+    - an empty DataFrame is written as a single newline, blank lines are skipped
+
+    :param path: path of the JSON lines file
+    :type path: str
+    :return: records
+    :rtype: list
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def statement_chains(rows: list):
+    """orders the statements of every ECC by c_componentorder and derives the reading order links
+    - all statements of an ECC have to be in ``rows``, WRDSFetcher windows never split an ECC
+
+    :param rows: statement records as loaded from ``batch.json``
+    :type rows: list
+    :return: (NEXT links as keydevid/from_id/to_id rows, FIRST/LAST pointers as keydevid/first_id/last_id rows)
+    :rtype: tuple
+    """
+    by_ecc = {}
+    for row in rows:
+        by_ecc.setdefault(int(row["keydevid"]), []).append(row)
+
+    next_links, pointers = [], []
+    for keydevid, statements in by_ecc.items():
+        statements.sort(key=lambda row: int(row["c_componentorder"]))
+        ids = [int(row["c_transcriptcomponentid"]) for row in statements]
+        next_links.extend({"keydevid": keydevid, "from_id": a, "to_id": b} for a, b in zip(ids, ids[1:]))
+        pointers.append({"keydevid": keydevid, "first_id": ids[0], "last_id": ids[-1]})
+    return next_links, pointers
+
 class WRDSFetcher:
     """
     WRDSFetcher handles retrieval and preparation of WRDS (Wharton Research Data Services) transcript data for a given company ID.
@@ -76,16 +159,30 @@ class WRDSFetcher:
     :type company_id: int
     :param wrds_db: An active connection to the WRDS database.
     :type wrds_db: wrds.Connection
+    :param batch_name: Prefix of the local JSON files, lets parallel workers keep separate files.
+    :type batch_name: str
+    :param window_size: Maximum number of transcripts fetched per window.
+    :type window_size: int
+    :param text_storage: ``inline`` keeps the text on every Statement, ``shared`` stores each distinct text
+        once as a Text node keyed by its hash.
+    :type text_storage: str
  
     :ivar company_id: Unique identifier for the company whose transcript data is being fetched.
     :ivar wrds_db: An active connection to the WRDS database (Wharton Research Data Services)
     :ivar import_path: Local file path where the fetched data will be stored in JSON format (batch, batch_participants, batch_unique_participants).
+    :ivar seen_participants: c_transcriptpersonids already written in an earlier window of this company.
+    :ivar seen_texts: text hashes already written in an earlier window of this company (``shared`` only).
  
-    :raises ValueError: If no data is returned from the query.
+    :raises NoDataError: If no data is returned from the query.
+
+    .. method:: get_windows()
+
+        Splits the ECCs of the company into windows of at most ``window_size`` transcripts,
+        in chronological order. All transcripts of one ECC (keydevid) stay in the same window.
  
-    .. method:: get_wrds_data()
+    .. method:: get_wrds_data(keydevids=None)
  
-        Executes a SQL query to fetch and rank transcript component data for the specified company.
+        Executes a SQL query to fetch and rank transcript component data for the specified company (or one window of it).
  
         - Filters transcripts starting from 2014-01-01.
         - Includes speaker names, types, and component texts.
@@ -94,31 +191,84 @@ class WRDSFetcher:
         - Saves the complete data and separate participant-related data to JSON files:
             - ``batch.json``: All transcript components.
             - ``batch_participants.json``: Unique participant and event combinations.
-            - ``batch_participants_unique.json``: Unique participants only.
+            - ``batch_participants_unique.json``: Participants not written in an earlier window.
+            - ``batch_texts.json``: Distinct texts not written in an earlier window (``shared`` only).
         - Logs the data-saving process and handles cases where no data is returned.
  
     **Usage Example**::
  
         fetcher = WRDSFetcher(company_id=12345, wrds_db=wrds_conn)
-        fetcher.get_wrds_data()
+        for keydevids in fetcher.get_windows():
+            fetcher.get_wrds_data(keydevids)
     """
     
-    def __init__(self, company_id: int, wrds_db: wrds.Connection):
+    def __init__(self, company_id: int, wrds_db: wrds.Connection, batch_name: str = "batch", window_size: int = 200, text_storage: str = "inline"):
+        if text_storage not in ("inline", "shared"):
+            raise ValueError(f"Unknown text_storage {text_storage}")
         self.company_id = company_id
         self.wrds_db = wrds_db
-        self.import_path = os.path.expanduser("/Users/joey/Desktop/uni/Master/graph_builder/local_int/")
+        self.batch_name = batch_name
+        self.window_size = window_size
+        self.text_storage = text_storage
+        self.seen_participants = set()
+        self.seen_texts = set()
+        self.import_path = IMPORT_PATH
+
+    def get_windows(self):
+        """this method splits the ECCs of the company into windows so that companies with
+        a decade of transcripts are not materialised in one DataFrame
+        - windows are filled with ECCs in chronological order up to ``window_size`` transcripts
+        - all transcripts of one ECC stay together, the ROW_NUMBER() deduplication in
+          get_wrds_data() ranks the transcripts of an ECC against each other
+
+        :return: list of keydevid lists, ``[None]`` if the company fits into one window
+        :rtype: list
+        """
+        query = f"""
+        SELECT keydevid, COUNT(DISTINCT transcriptid) AS transcripts, MIN(mostimportantdateutc) AS eventdate
+        FROM ciq_transcripts.wrds_transcript_detail
+        WHERE companyid = {self.company_id}
+        AND mostimportantdateutc >= '2014-01-01'
+        GROUP BY keydevid
+        ORDER BY eventdate, keydevid;
+        """
+        eccs = self.wrds_db.raw_sql(query)
 
-    def get_wrds_data(self):
-        """this method handles the WRDS querying for one single company as well
-        as the cleaning of that data
+        if eccs.empty:
+            logging.info(f"No data returned for company {self.company_id}")
+            raise NoDataError("No data returned.")
+        if eccs["transcripts"].sum() <= self.window_size:
+            return [None]
+
+        windows = []
+        window, window_transcripts = [], 0
+        for keydevid, transcripts in zip(eccs["keydevid"], eccs["transcripts"]):
+            if window and window_transcripts + transcripts > self.window_size:
+                windows.append(window)
+                window, window_transcripts = [], 0
+            window.append(int(keydevid))
+            window_transcripts += int(transcripts)
+        windows.append(window)
+
+        logging.info(f"Company {self.company_id}: {eccs['transcripts'].sum()} transcripts split into {len(windows)} windows")
+        return windows
+
+    def get_wrds_data(self, keydevids: list = None):
+        """this method handles the WRDS querying for one single company (or one window of
+        its ECCs) as well as the cleaning of that data
         it then saves the data into three separate JSON files for upload to Neo4j
 
         - ``batch.json``: All transcript components/Statements.
         - ``batch_participants.json``: Unique participant -> ECC-event combinations.
-        - ``batch_participants_unique.json``: Unique participants only.
+        - ``batch_participants_unique.json``: Participants not written in an earlier window.
 
+        :param keydevids: ECCs of the window to fetch, all ECCs of the company if None
+        :type keydevids: list
         :return: None
         """
+        window_filter = ""
+        if keydevids is not None:
+            window_filter = f"AND keydevid IN ({', '.join(str(int(k)) for k in keydevids)})"
 
         query = f"""
         WITH company_subset AS (
@@ -126,6 +276,7 @@ class WRDSFetcher:
             FROM ciq_transcripts.wrds_transcript_detail
             WHERE companyid = {self.company_id}
             AND mostimportantdateutc >= '2014-01-01'
+            {window_filter}
         ),
         ranked_transcripts AS (
             SELECT
@@ -161,7 +312,7 @@ class WRDSFetcher:
         
         if df.empty:
             logging.info(f"No data returned for company {self.company_id}")
-            raise ValueError("No data returned.")
+            raise NoDataError("No data returned.")
         
         df["c_transcriptpersonid"] = df["c_transcriptpersonid"].astype('Int64')
         df["keydevid"] = df["keydevid"].astype('Int64')
@@ -169,29 +320,44 @@ class WRDSFetcher:
         if duplicate_count > 0:
             logging.info(f"Found and dropping {duplicate_count} duplicate transcript components.")
         df = df.drop_duplicates(subset=["c_transcriptcomponentid"])
-        
-        json_filename = f"batch.json"
+
+        json_filename = f"{self.batch_name}.json"
         full_path = os.path.join(self.import_path, json_filename)
-        df.to_json(full_path, orient="records", lines=True, force_ascii=False)
+        if self.text_storage == "shared":
+            # every distinct text is written once, the statements only keep its hash and length
+            df["componenttext"] = df["componenttext"].fillna("")
+            df["text_hash"] = df["componenttext"].map(text_hash)
+            df["text_length"] = df["componenttext"].str.len()
+
+            texts_df = df[["text_hash", "componenttext", "text_length"]].drop_duplicates(subset=["text_hash"])
+            texts_df = texts_df[~texts_df["text_hash"].isin(self.seen_texts)]
+            self.seen_texts.update(texts_df["text_hash"])
+            logging.info(f"{len(texts_df)} distinct new texts for {len(df)} statements")
+
+            full_path_texts = os.path.join(self.import_path, f"{self.batch_name}_texts.json")
+            texts_df.to_json(full_path_texts, orient="records", lines=True, force_ascii=False)
+            df.drop(columns=["componenttext"]).to_json(full_path, orient="records", lines=True, force_ascii=False)
+        else:
+            df.to_json(full_path, orient="records", lines=True, force_ascii=False)
 
         # filter duplicates out in the results df
         participants_df = df[[
             "c_transcriptpersonid", "transcriptpersonname", "speakertypename", "keydevid"
         ]].dropna(subset=["c_transcriptpersonid", "transcriptpersonname", "speakertypename"])
 
-
-        participants_df_unique = participants_df.drop_duplicates(subset=["c_transcriptpersonid"])
-
         # duplicates would be a row not unique by ECC (keydevid) and Statement (c_transcriptpersonid)
         participants_df = participants_df.drop_duplicates(subset=["c_transcriptpersonid", "keydevid"])
  
-        full_path_participants = os.path.join(self.import_path, f"batch_participants.json")
+        full_path_participants = os.path.join(self.import_path, f"{self.batch_name}_participants.json")
         participants_df.to_json(full_path_participants, orient="records", lines=True, force_ascii=False)
  
         # generate the unique participants from the filtered participants_df
+        # participants that already came up in an earlier window of this company are not written again
         participants_df_unique = participants_df.drop_duplicates(subset=["c_transcriptpersonid"])
+        participants_df_unique = participants_df_unique[~participants_df_unique["c_transcriptpersonid"].isin(self.seen_participants)]
+        self.seen_participants.update(int(p) for p in participants_df_unique["c_transcriptpersonid"])
 
-        full_path_participants_unique = os.path.join(self.import_path, f"batch_participants_unique.json")
+        full_path_participants_unique = os.path.join(self.import_path, f"{self.batch_name}_participants_unique.json")
         participants_df_unique.to_json(full_path_participants_unique, orient="records", lines=True, force_ascii=False)
         
         # Debug: Check if file was saved
@@ -204,8 +370,14 @@ class Neo4jUploader:
     """
     Neo4jUploader uploads transcript and participant data into a Neo4j graph database.
 
-    :param driver: An active Neo4j driver instance.
+    :param driver: An active Neo4j driver instance, None if only upload_async() is used.
     :type driver: neo4j.GraphDatabase.driver
+    :param batch_name: Prefix of the local JSON files written by WRDSFetcher.
+    :type batch_name: str
+    :param chunk_size: Number of rows sent per UNWIND statement.
+    :type chunk_size: int
+    :param text_storage: ``inline`` or ``shared``, has to match the WRDSFetcher that wrote the files.
+    :type text_storage: str
 
     :ivar import_path: Path to the directory containing the JSON files.
     :ivar full_path: Path to the JSON file with transcript components. 
@@ -216,84 +388,308 @@ class Neo4jUploader:
 
         - Handles local files for participants and Statements
         - Uploads participant and statement nodes into Neo4j from local JSON files.
+        - ``shared`` text storage: uploads Text nodes for hashes not yet in the graph and links
+          every Statement to its text with HAS_TEXT instead of setting ``text`` on it.
+
+    .. method:: upload_async(engine)
+
+        Uploads nodes and edges of the batch with ``AsyncUploadEngine``, several chunks in flight at once.
 
     .. method:: create_edges()
 
         Creates relationships in Neo4j:
             - PARTICIPATED_IN (Participant → ECC)
             - WAS_GIVEN_AT (Statement → ECC)
+            - NEXT (Statement → Statement) in ``c_componentorder`` order
+            - FIRST_STATEMENT / LAST_STATEMENT (ECC → Statement)
+        and counts newly created edges into ``participant_count`` and ``statement_count`` on the ECC.
+
+    Every query receives only the columns it uses (``*_COLUMNS``), as parallel lists with the ids
+    coerced to int locally, so no ``toInteger()`` is needed on the server.
+    """
+    PARTICIPANT_NODE_COLUMNS = {"c_transcriptpersonid": int, "transcriptpersonname": str, "speakertypename": str}
+    STATEMENT_NODE_COLUMNS = {"c_transcriptcomponentid": int, "componenttext": str, "transcriptpersonname": str, "c_componentorder": int}
+    SHARED_STATEMENT_NODE_COLUMNS = {"c_transcriptcomponentid": int, "text_hash": str, "text_length": int, "transcriptpersonname": str, "c_componentorder": int}
+    TEXT_NODE_COLUMNS = {"text_hash": str, "componenttext": str, "text_length": int}
+    PARTICIPATED_IN_COLUMNS = {"keydevid": int, "c_transcriptpersonid": int}
+    WAS_GIVEN_AT_COLUMNS = {"keydevid": int, "c_transcriptcomponentid": int}
+    NEXT_COLUMNS = {"from_id": int, "to_id": int}
+    POINTER_COLUMNS = {"keydevid": int, "first_id": int, "last_id": int}
+
+    PARTICIPANT_NODE_QUERY = """
+        UNWIND range(0, size($c_transcriptpersonid) - 1) AS i
+        MERGE (p:Participant { c_transcriptpersonid: $c_transcriptpersonid[i] })
+        SET p.name = $transcriptpersonname[i],
+            p.description = $speakertypename[i]
+    """
+
+    # boilerplate is usually in the graph already, its text is not sent again
+    EXISTING_TEXTS_QUERY = """
+        UNWIND $hashes AS hash
+        MATCH (t:Text {hash: hash})
+        RETURN t.hash AS hash
+    """
+
+    TEXT_NODE_QUERY = """
+        UNWIND range(0, size($text_hash) - 1) AS i
+        MERGE (t:Text {hash: $text_hash[i]})
+        ON CREATE SET t.text = $componenttext[i],
+            t.length = $text_length[i]
+    """
+
+    # SECOND ITERATION
+    STATEMENT_NODE_QUERY = """
+        UNWIND range(0, size($c_transcriptcomponentid) - 1) AS i
+        MERGE (s:Statement { c_transcriptcomponentid: $c_transcriptcomponentid[i] })
+        SET s.text = $componenttext[i],
+            s.name = $transcriptpersonname[i],
+            s.order = $c_componentorder[i]
+    """
+
+    # FIRST ITERATION
+
+    # STATEMENT_NODE_QUERY = """
+    #     UNWIND range(0, size($c_transcriptcomponentid) - 1) AS i
+    #     CREATE (s:Statement {
+    #         c_transcriptcomponentid: $c_transcriptcomponentid[i],
+    #         text: $componenttext[i],
+    #         name: $transcriptpersonname[i],
+    #         order: $c_componentorder[i]})
+    # """
+
+    SHARED_STATEMENT_NODE_QUERY = """
+        UNWIND range(0, size($c_transcriptcomponentid) - 1) AS i
+        MATCH (t:Text {hash: $text_hash[i]})
+        MERGE (s:Statement { c_transcriptcomponentid: $c_transcriptcomponentid[i] })
+        SET s.text_hash = $text_hash[i],
+            s.text_length = $text_length[i],
+            s.name = $transcriptpersonname[i],
+            s.order = $c_componentorder[i]
+        REMOVE s.text
+        MERGE (s)-[:HAS_TEXT]->(t)
     """
-    def __init__(self, driver):
+
+    # SECOND ITERATION
+    PARTICIPATED_IN_QUERY = """
+        UNWIND range(0, size($keydevid) - 1) AS i
+        MATCH (e:ECC {keydevid: $keydevid[i]})
+        MATCH (p:Participant {c_transcriptpersonid: $c_transcriptpersonid[i]})
+        MERGE (p)-[:PARTICIPATED_IN]->(e)
+        ON CREATE SET e.participant_count = coalesce(e.participant_count, 0) + 1
+    """
+
+    # FIRST ITERATION
+
+    # PARTICIPATED_IN_QUERY = """
+    #     UNWIND range(0, size($keydevid) - 1) AS i
+    #     MATCH (e:ECC {keydevid: $keydevid[i]})
+    #     MATCH (p:Participant {c_transcriptpersonid: $c_transcriptpersonid[i]})
+    #     CREATE (p)-[:PARTICIPATED_IN]->(e)
+    #     SET e.participant_count = coalesce(e.participant_count, 0) + 1
+    # """
+
+    # SECOND ITERATION
+    WAS_GIVEN_AT_QUERY = """
+        UNWIND range(0, size($keydevid) - 1) AS i
+        MATCH (e:ECC {keydevid: $keydevid[i]})
+        MATCH (s:Statement {c_transcriptcomponentid: $c_transcriptcomponentid[i]})
+        MERGE (s)-[:WAS_GIVEN_AT]->(e)
+        ON CREATE SET e.statement_count = coalesce(e.statement_count, 0) + 1
+    """
+
+    # FIRST ITERATION
+
+    # WAS_GIVEN_AT_QUERY = """
+    #     UNWIND range(0, size($keydevid) - 1) AS i
+    #     MATCH (e:ECC {keydevid: $keydevid[i]})
+    #     MATCH (s:Statement {c_transcriptcomponentid: $c_transcriptcomponentid[i]})
+    #     CREATE (s)-[:WAS_GIVEN_AT]->(e)
+    #     SET e.statement_count = coalesce(e.statement_count, 0) + 1
+    # """
+
+    # reading order: a transcript is walked from FIRST_STATEMENT along NEXT
+    # a NEXT of an earlier upload that points elsewhere is replaced, the transcript may have changed
+    NEXT_QUERY = """
+        UNWIND range(0, size($from_id) - 1) AS i
+        MATCH (a:Statement {c_transcriptcomponentid: $from_id[i]})
+        MATCH (b:Statement {c_transcriptcomponentid: $to_id[i]})
+        CALL {
+            WITH a, b
+            OPTIONAL MATCH (a)-[old:NEXT]->(other)
+            WHERE other <> b
+            DELETE old
+        }
+        MERGE (a)-[:NEXT]->(b)
+    """
+
+    # pointers of an earlier upload of the ECC are replaced, the transcript may have changed
+    # - the last statement has no NEXT row, a NEXT it had in an earlier upload is removed here
+    POINTER_QUERY = """
+        UNWIND range(0, size($keydevid) - 1) AS i
+        MATCH (e:ECC {keydevid: $keydevid[i]})
+        MATCH (first:Statement {c_transcriptcomponentid: $first_id[i]})
+        MATCH (last:Statement {c_transcriptcomponentid: $last_id[i]})
+        CALL {
+            WITH e
+            OPTIONAL MATCH (e)-[old:FIRST_STATEMENT|LAST_STATEMENT]->()
+            DELETE old
+        }
+        CALL {
+            WITH last
+            OPTIONAL MATCH (last)-[old:NEXT]->()
+            DELETE old
+        }
+        MERGE (e)-[:FIRST_STATEMENT]->(first)
+        MERGE (e)-[:LAST_STATEMENT]->(last)
+    """
+
+    def __init__(self, driver, batch_name: str = "batch", chunk_size: int = 2000, text_storage: str = "inline"):
         self.driver = driver
-        self.import_path = os.path.expanduser("/Users/joey/Desktop/uni/Master/graph_builder/local_int/")
+        self.chunk_size = chunk_size
+        self.text_storage = text_storage
+        self.import_path = IMPORT_PATH
 
         # This is the Statement data separate from the Participant data.
         # For the Statement Nodes and Edges to ECC
-        self.json_filename = f"batch.json"
+        self.json_filename = f"{batch_name}.json"
         self.full_path = os.path.join(self.import_path, self.json_filename)
 
         # These are participants unique by c_transcriptpersonid and keydevid.
         # For the Participant-Ecc Edges
-        self.json_filename_participants = f"batch_participants.json"
+        self.json_filename_participants = f"{batch_name}_participants.json"
         self.full_path_participants = os.path.join(self.import_path, self.json_filename_participants)
 
         # These are participants unique by c_transcriptpersonid.
         # for the Participant Nodes
-        self.json_filename_unique_participants = f"batch_participants_unique.json"
+        self.json_filename_unique_participants = f"{batch_name}_participants_unique.json"
         self.full_path_participants_unique = os.path.join(self.import_path, self.json_filename_unique_participants)
 
-    def upload_to_neo4j(self):
-        """this method handles the file structure locally (assigns) and uploads Nodes to Neo4j
-        - uses neo4J native transaction method execute_write() https://neo4j.com/docs/python-manual/current/transactions/
+        # These are the distinct statement texts keyed by hash (only in the shared text storage mode).
+        # For the Text Nodes
+        self.json_filename_texts = f"{batch_name}_texts.json"
+        self.full_path_texts = os.path.join(self.import_path, self.json_filename_texts)
+
+    def load_batch(self):
+        """this method reads the local JSON files of the current batch into the class instance
 
         :loads to class instance:
         - ``data`` from ``batch.json``: All transcript components/Statements.
         - ``participant_data`` from ``batch_participants.json``: Unique participant -> ECC-event combinations.
         - ``participants_unique`` from ``batch_participants_unique.json``: Unique participants only.
+        - ``texts`` from ``batch_texts.json``: Distinct statement texts (``shared`` text storage only).
 
         :return: None
         """
-
         # local file for Statements
-        with open(self.full_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            data = [json.loads(line) for line in lines]
-        self.data = data
-        print(f"uploading {len(data)} records from {self.json_filename} to Neo4j")
+        self.data = read_json_lines(self.full_path)
+        print(f"uploading {len(self.data)} records from {self.json_filename} to Neo4j")
         
         # Local file for non-uniqe participants (for edges with ECC)
-        with open(self.full_path_participants, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            participants = [json.loads(line) for line in lines]
-        self.participant_data = participants
+        self.participant_data = read_json_lines(self.full_path_participants)
 
         # local file for unique Participants (Participant Nodes)
-        with open(self.full_path_participants_unique, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            participants_unique = [json.loads(line) for line in lines]
-        self.participants_unique = participants_unique
+        # empty when every participant of the window came up in an earlier window
+        self.participants_unique = read_json_lines(self.full_path_participants_unique)
+
+        # local file for distinct texts (Text Nodes)
+        # empty when every text of the window was already written by an earlier window
+        self.texts = []
+        if self.text_storage == "shared":
+            self.texts = read_json_lines(self.full_path_texts)
+
+    def _jobs(self, label: str, query: str, rows: list, columns: dict):
+        # chunking the upload data to not overload the db processes
+        # often large batches took exceeding time
+        return [(label, query, to_columns(chunk, columns)) for chunk in chunked(rows, self.chunk_size)]
+
+    def participant_jobs(self):
+        return self._jobs("participants-nodes", self.PARTICIPANT_NODE_QUERY, self.participants_unique, self.PARTICIPANT_NODE_COLUMNS)
+
+    def text_hashes(self):
+        return [row["text_hash"] for row in self.texts]
+
+    def text_jobs(self, existing_texts: set):
+        """Text nodes for the texts of the batch whose hash is not in the graph yet
+
+        :param existing_texts: hashes returned by ``EXISTING_TEXTS_QUERY``
+        :type existing_texts: set
+        :return: jobs
+        :rtype: list
+        """
+        new_texts = [row for row in self.texts if row["text_hash"] not in existing_texts]
+        return self._jobs("text-nodes", self.TEXT_NODE_QUERY, new_texts, self.TEXT_NODE_COLUMNS)
+
+    def statement_jobs(self):
+        if self.text_storage == "shared":
+            return self._jobs("statements-nodes", self.SHARED_STATEMENT_NODE_QUERY, self.data, self.SHARED_STATEMENT_NODE_COLUMNS)
+        return self._jobs("statements-nodes", self.STATEMENT_NODE_QUERY, self.data, self.STATEMENT_NODE_COLUMNS)
+
+    def _ecc_jobs(self, label: str, query: str, rows: list, columns: dict, lock_order: str = None):
+        """like _jobs(), but the rows of one ECC (keydevid) are never split over two chunks,
+        so within a phase every ECC (and its Statements) is written by a single transaction
+        - an ECC with more than ``chunk_size`` rows gets a chunk of its own
+
+        :param lock_order: column the rows of a chunk are sorted by, nodes shared between chunks
+            (Participants) are then locked in the same order by every transaction
+        :type lock_order: str
+        :return: jobs
+        :rtype: list
+        """
+        by_ecc = {}
+        for row in rows:
+            by_ecc.setdefault(int(row["keydevid"]), []).append(row)
+
+        chunks, chunk = [], []
+        for ecc_rows in by_ecc.values():
+            if chunk and len(chunk) + len(ecc_rows) > self.chunk_size:
+                chunks.append(chunk)
+                chunk = []
+            chunk.extend(ecc_rows)
+        if chunk:
+            chunks.append(chunk)
+
+        if lock_order is not None:
+            chunks = [sorted(chunk, key=lambda row: int(row[lock_order])) for chunk in chunks]
+        return [(label, query, to_columns(chunk, columns)) for chunk in chunks]
+
+    def edge_phases(self):
+        """PARTICIPATED_IN, WAS_GIVEN_AT, NEXT and FIRST/LAST pointer jobs, they only need the
+        nodes of participant_jobs() and statement_jobs()
+        - one phase per relationship type: all four lock the ECC or its Statements, run side by side
+          the chunks of different types would wait on (or deadlock over) the same nodes
+        - within a phase the chunks are partitioned by ECC, see _ecc_jobs()
+
+        :return: phases, each a list of jobs
+        :rtype: list
+        """
+        next_links, pointers = statement_chains(self.data)
+        return [
+            self._ecc_jobs("participants", self.PARTICIPATED_IN_QUERY, self.participant_data, self.PARTICIPATED_IN_COLUMNS, lock_order="c_transcriptpersonid"),
+            self._ecc_jobs("statements", self.WAS_GIVEN_AT_QUERY, self.data, self.WAS_GIVEN_AT_COLUMNS),
+            self._ecc_jobs("statement-links", self.NEXT_QUERY, next_links, self.NEXT_COLUMNS),
+            self._ecc_jobs("ecc-pointers", self.POINTER_QUERY, pointers, self.POINTER_COLUMNS),
+        ]
+
+    def upload_to_neo4j(self):
+        """this method handles the file structure locally (assigns) and uploads Nodes to Neo4j
+        - uses neo4J native transaction method execute_write() https://neo4j.com/docs/python-manual/current/transactions/
+        - the files are read by load_batch()
+
+        :return: None
+        """
+        self.load_batch()
 
         with self.driver.session() as session:
             # defining the transaction like this ensures atomic transactions with the neo4j db
             # particularly when chunking or batching this is important since we could have duplicates 
             # between chunks logically or overwrite certain data
-            def write_tx(tx, data, unique_participants):
-                # chunking the upload data to not overload the db processes
-                # often large batches took exceeding time
-                chunk_size = 2000
-
+            def write_tx(tx):
                 try:
+                    for label, query, params in self.participant_jobs():
+                        tx.run(query, **params)
 
-                    for chunk in chunked(unique_participants,chunk_size):
-                        tx.run("""
-                            UNWIND $rows AS row
-                            MERGE (p:Participant { c_transcriptpersonid: toInteger(row.c_transcriptpersonid) })
-                            SET p.name = row.transcriptpersonname,
-                                p.description = row.speakertypename
-                        """, rows=chunk)
-
-                        print(f"[{os.getpid()}] Processed {len(unique_participants)} participants-nodes.")
-                        logging.info(f"[{os.getpid()}] Processing {len(unique_participants)} participants-nodes.")
+                        print(f"[{os.getpid()}] Processed {len(self.participants_unique)} participants-nodes.")
+                        logging.info(f"[{os.getpid()}] Processing {len(self.participants_unique)} participants-nodes.")
 
                 except ConstraintError as ce:
                     print(f"constraint violation (nodecreation_participant){ce}")
@@ -305,29 +701,20 @@ class Neo4jUploader:
                     logging.error(f"Failed to insert nodecreation_participant\nError: {e}")
 
                 try:
-                    for chunk in chunked(data,chunk_size):
-                        # SECOND ITERATION 
-                        tx.run("""
-                            UNWIND $rows AS row
-                            MERGE (s:Statement { c_transcriptcomponentid: toInteger(row.c_transcriptcomponentid) })
-                            SET s.text = row.componenttext,
-                                s.name = row.transcriptpersonname,
-                                s.order = toInteger(row.c_componentorder)
-                        """, rows=chunk)
-
-                        # FIRST ITERATION
-
-                        # tx.run("""
-                        #     UNWIND $rows AS row
-                        #     CREATE (s:Statement {
-                        #         c_transcriptcomponentid: toInteger(row.c_transcriptcomponentid),
-                        #         text: row.componenttext,
-                        #         name: row.transcriptpersonname,
-                        #         order: toInteger(row.c_componentorder)})
-                        # """, rows=chunk)
-
-                        print(f"[{os.getpid()}] Processed {len(data)} statements-nodes.")
-                        logging.info(f"[{os.getpid()}] Processed {len(data)} statements-nodes.")
+                    if self.texts:
+                        existing_texts = set()
+                        for hashes in chunked(self.text_hashes(), self.chunk_size):
+                            existing_texts.update(record["hash"] for record in tx.run(self.EXISTING_TEXTS_QUERY, hashes=hashes))
+                        for label, query, params in self.text_jobs(existing_texts):
+                            tx.run(query, **params)
+                        print(f"[{os.getpid()}] Processed {len(self.texts)} text-nodes.")
+                        logging.info(f"[{os.getpid()}] Processed {len(self.texts)} text-nodes.")
+
+                    for label, query, params in self.statement_jobs():
+                        tx.run(query, **params)
+
+                        print(f"[{os.getpid()}] Processed {len(self.data)} statements-nodes.")
+                        logging.info(f"[{os.getpid()}] Processed {len(self.data)} statements-nodes.")
 
                 except ConstraintError as ce:
                     print(f"constraint violation (nodecreation-statement)")
@@ -340,71 +727,118 @@ class Neo4jUploader:
 
             # this is the neo4j transaction function that handles the transaction
             # session passes the db instance and
-            session.execute_write(write_tx, self.data, self.unique_participants)
+            session.execute_write(write_tx)
+        print(f"finished uploading {self.json_filename}")
+
+    async def upload_async(self, engine: AsyncUploadEngine):
+        """this method uploads the nodes and edges of the current batch through AsyncUploadEngine
+        instead of upload_to_neo4j() and create_edges()
+        - every chunk is its own write transaction, up to ``engine.concurrency`` of them in flight
+        - participant/text nodes, statement nodes (they MATCH their Text) and every relationship type
+          of edge_phases() are run as phases one after the other
+        - the engine (and its async driver) is shared by all windows of a company, see process_company()
+
+        :param engine: engine over an open async driver
+        :type engine: AsyncUploadEngine
+        :return: None
+        """
+        self.load_batch()
+
+        existing_texts = set()
+        if self.texts:
+            existing_texts = await engine.read_values(
+                self.EXISTING_TEXTS_QUERY, "hash", "hashes", self.text_hashes(), self.chunk_size
+            )
+        await engine.run([
+            self.participant_jobs() + self.text_jobs(existing_texts),
+            self.statement_jobs(),
+        ] + self.edge_phases())
         print(f"finished uploading {self.json_filename}")
 
     def create_edges(self):
         """this method creates the edges for Statement and Participant nodes, using
         also the native execute_write() function from Neo4j
+        - only the id columns each edge needs are sent, the statement text stays local
 
         :return: None
         """
         with self.driver.session() as session:
             print(f"Uploading {self.json_filename} to Neo4j - Creating edges")
 
-            def edge_tx(tx, data, participants):
+            def edge_tx(tx):
                 try:
-                    # SECOND ITERATION
-                    tx.run("""
-                        UNWIND $rows AS row
-                        MATCH (e:ECC {keydevid: row.keydevid})
-                        MATCH (p:Participant {c_transcriptpersonid: toInteger(row.c_transcriptpersonid)})
-                        MERGE (p)-[:PARTICIPATED_IN]->(e)
-                        """, rows=participants)
-                    
-                    # FIRST ITERATION
-
-                    # tx.run("""
-                    #     UNWIND $rows AS row
-                    #     MATCH (e:ECC {keydevid: row.keydevid})
-                    #     MATCH (p:Participant {c_transcriptpersonid: toInteger(row.c_transcriptpersonid)})
-                    #     CREATE (p)-[:PARTICIPATED_IN]->(e)
-                    #     """, rows=participants)
-                    print(f"[{os.getpid()}] Processed {len(participants)} participants.")
-                    logging.info(f"[{os.getpid()}] Processed {len(participants)} participants.")
-                 
-                    # SECOND ITERATION
-                    tx.run("""
-                        UNWIND $rows AS row
-                        MATCH (e:ECC {keydevid: row.keydevid})
-                        MATCH (s:Statement {c_transcriptcomponentid: toInteger(row.c_transcriptcomponentid)})
-                        MERGE (s)-[:WAS_GIVEN_AT]->(e)
-                    """, rows=data)
-
-                    # FIRST ITERATION
-
-                    # tx.run("""
-                    #     UNWIND $rows AS row
-                    #     MATCH (e:ECC {keydevid: row.keydevid})
-                    #     MATCH (s:Statement {c_transcriptcomponentid: toInteger(row.c_transcriptcomponentid)})
-                    #     CREATE (s)-[:WAS_GIVEN_AT]->(e)
-                    # """, rows=data)
-                    print(f"[{os.getpid()}] Processed {len(data)} statements.")
-                    logging.info(f"[{os.getpid()}] Processed {len(data)} statements.")
+                    processed = {}
+                    for label, query, params in (job for jobs in self.edge_phases() for job in jobs):
+                        tx.run(query, **params)
+                        processed[label] = processed.get(label, 0) + len(next(iter(params.values())))
+                    for label, rows in processed.items():
+                        print(f"[{os.getpid()}] Processed {rows} {label}.")
+                        logging.info(f"[{os.getpid()}] Processed {rows} {label}.")
                     
                 except ConstraintError as ce:
-                    print(f"constraint violation (edgecreation) for row: {row['keydevid']}\nNeo4j Error: {ce}")
-                    logging.error(f"constraint violation (edgecreation) for row: {row['keydevid']}\nNeo4j Error: {ce}")
+                    print(f"constraint violation (edgecreation) for {self.json_filename}\nNeo4j Error: {ce}")
+                    logging.error(f"constraint violation (edgecreation) for {self.json_filename}\nNeo4j Error: {ce}")
                 except Neo4jError as ne:
                     print(f"Neo4j transaction failed: {ne.code} – {ne.message}")
                     logging.error(f"Neo4j transaction failed: {ne.code} – {ne.message}")
                 except Exception as e:
-                    print(f"Failed to create edge for row: {row}\nError: {e}")
-                    logging.error(f"Failed to create edge for row: {row}\nError: {e}")
+                    print(f"Failed to create edges for {self.json_filename}\nError: {e}")
+                    logging.error(f"Failed to create edges for {self.json_filename}\nError: {e}")
 
-            session.execute_write(edge_tx, self.data, self.participant_data)
+            session.execute_write(edge_tx)
         print(f"finished edgecreation {self.json_filename}")
    
+def reconcile_ecc_aggregates(driver):
+    """this function recomputes statement_count and participant_count on every ECC node in bulk,
+    for graphs loaded before the counters existed or after edges were changed by hand
+    - runs in batches of ECCs with CALL {} IN TRANSACTIONS, needs an auto-commit session
+
+    :param driver: An active Neo4j driver instance
+    :type driver: neo4j.GraphDatabase.driver
+    :return: None
+    """
+    with driver.session() as session:
+        session.run("""
+            MATCH (e:ECC)
+            CALL {
+                WITH e
+                SET e.statement_count = COUNT { (e)<-[:WAS_GIVEN_AT]-() },
+                    e.participant_count = COUNT { (e)<-[:PARTICIPATED_IN]-() }
+            } IN TRANSACTIONS OF 10000 ROWS
+        """).consume()
+    print("✅ Reconciled ECC aggregates.")
+    logging.info("Reconciled ECC aggregates.")
+
+def link_statement_chains(driver):
+    """this function backfills the NEXT chain and the FIRST/LAST pointers for every ECC
+    that has statements but no FIRST_STATEMENT yet (graphs loaded before create_edges() linked them)
+    - runs in batches of ECCs with CALL {} IN TRANSACTIONS, needs an auto-commit session
+
+    :param driver: An active Neo4j driver instance
+    :type driver: neo4j.GraphDatabase.driver
+    :return: None
+    """
+    with driver.session() as session:
+        session.run("""
+            MATCH (e:ECC)
+            WHERE NOT (e)-[:FIRST_STATEMENT]->() AND (e)<-[:WAS_GIVEN_AT]-()
+            CALL {
+                WITH e
+                MATCH (s:Statement)-[:WAS_GIVEN_AT]->(e)
+                WITH e, s ORDER BY s.order
+                WITH e, collect(s) AS statements
+                WITH e, statements, statements[0] AS first, statements[-1] AS last
+                MERGE (e)-[:FIRST_STATEMENT]->(first)
+                MERGE (e)-[:LAST_STATEMENT]->(last)
+                WITH statements
+                UNWIND range(0, size(statements) - 2) AS i
+                WITH statements[i] AS a, statements[i + 1] AS b
+                MERGE (a)-[:NEXT]->(b)
+            } IN TRANSACTIONS OF 1000 ROWS
+        """).consume()
+    print("✅ Linked statement chains.")
+    logging.info("Linked statement chains.")
+
 class CompanyMetadataHandler:
     """
     CompanyMetadataHandler handles retrieval and insertion of company metadata from a PostgreSQL database.
@@ -446,7 +880,59 @@ class CompanyMetadataHandler:
             conn.close()
             return df
 
-def process_company(row: pd.Series,wrds_db: wrds.Connection):
+def fetched_windows(wrds_fetcher: WRDSFetcher, windows: list, label: str):
+    """fetches the windows of a company one after the other into the local JSON files
+    - yields after each window so it is uploaded and released before the next one is queried
+    - windows WRDS has no data for are skipped
+
+    :param wrds_fetcher: fetcher of the company
+    :type wrds_fetcher: WRDSFetcher
+    :param windows: keydevid lists as returned by WRDSFetcher.get_windows()
+    :type windows: list
+    :param label: company name and id for the progress output
+    :type label: str
+    :return: generator over the keydevids of the fetched windows
+    :rtype: generator
+    """
+    for i, keydevids in enumerate(windows):
+        if len(windows) > 1:
+            print(f"[Company {label}] ➜ window {i + 1}/{len(windows)}")
+        try:
+            wrds_fetcher.get_wrds_data(keydevids)
+        except NoDataError:
+            continue
+        yield keydevids
+
+async def upload_windows_async(wrds_fetcher: WRDSFetcher, neo4j_uploader: Neo4jUploader, windows: list, label: str, concurrency: int):
+    """async counterpart of the window loop in process_company(), one async driver and one
+    AsyncUploadEngine are opened for all windows of the company
+    - WRDS is queried between the uploads, no transactions are in flight at that point
+
+    :param wrds_fetcher: fetcher of the company
+    :type wrds_fetcher: WRDSFetcher
+    :param neo4j_uploader: uploader reading the files of the same batch
+    :type neo4j_uploader: Neo4jUploader
+    :param windows: keydevid lists as returned by WRDSFetcher.get_windows()
+    :type windows: list
+    :param label: company name and id for the progress output
+    :type label: str
+    :param concurrency: write transactions in flight
+    :type concurrency: int
+    :return: number of uploaded windows
+    :rtype: int
+    """
+    driver = init_async_graph_DB()
+    try:
+        engine = AsyncUploadEngine(driver, concurrency=concurrency)
+        uploaded_windows = 0
+        for _ in fetched_windows(wrds_fetcher, windows, label):
+            await neo4j_uploader.upload_async(engine)
+            uploaded_windows += 1
+        return uploaded_windows
+    finally:
+        await driver.close()
+
+def process_company(row: pd.Series,wrds_db: wrds.Connection, batch_name: str = "batch", chunk_size: int = 2000, window_size: int = 200, text_storage: str = "inline", concurrency: int = 1):
     """this function handles the execution of the classes WRDSFetcher and Neo4jUploader
     for one company at a time
 
@@ -454,29 +940,61 @@ def process_company(row: pd.Series,wrds_db: wrds.Connection):
     :type row: pd.Series
     :param wrds_db: An active connection to the WRDS database (Wharton Research Data Services)
     :type wrds_db: wrds.Connection
+    :param batch_name: Prefix of the local JSON files for this company
+    :type batch_name: str
+    :param chunk_size: Number of rows sent per UNWIND statement
+    :type chunk_size: int
+    :param window_size: Maximum number of transcripts fetched and uploaded at once
+    :type window_size: int
+    :param text_storage: ``inline`` text on every Statement or ``shared`` Text nodes keyed by hash
+    :type text_storage: str
+    :param concurrency: write transactions in flight, above 1 the upload goes through AsyncUploadEngine
+    :type concurrency: int
+    :return: True if the company was loaded or WRDS has no transcripts for it (NoDataError),
+        False if it failed and was written to the failed companies log
+    :rtype: bool
     """
     companyid = row["companyid"]
     companyname = row["companyname"]
-    wrds_fetcher = WRDSFetcher(companyid, wrds_db)
-    driver = init_graph_DB()
-    neo4j_uploader = Neo4jUploader(driver)
+    label = f"{companyname},{companyid}"
+    driver = None
 
     try:
-        print(f"[Company {companyname},{companyid}] ➜ Fetching")
-        wrds_fetcher.get_wrds_data()
-        neo4j_uploader.upload_to_neo4j()
-        neo4j_uploader.create_edges()
-
-    except ValueError as ve:
+        wrds_fetcher = WRDSFetcher(companyid, wrds_db, batch_name=batch_name, window_size=window_size, text_storage=text_storage)
+
+        print(f"[Company {label}] ➜ Fetching")
+        windows = wrds_fetcher.get_windows()
+        if concurrency > 1:
+            # only the async driver is opened, the sync one would sit idle
+            neo4j_uploader = Neo4jUploader(None, batch_name=batch_name, chunk_size=chunk_size, text_storage=text_storage)
+            uploaded_windows = asyncio.run(upload_windows_async(wrds_fetcher, neo4j_uploader, windows, label, concurrency))
+        else:
+            driver = init_graph_DB()
+            neo4j_uploader = Neo4jUploader(driver, batch_name=batch_name, chunk_size=chunk_size, text_storage=text_storage)
+            uploaded_windows = 0
+            for _ in fetched_windows(wrds_fetcher, windows, label):
+                neo4j_uploader.upload_to_neo4j()
+                neo4j_uploader.create_edges()
+                uploaded_windows += 1
+
+        if uploaded_windows == 0:
+            raise NoDataError("No data returned.")
+        return True
+
+    # only the missing data marks the company as done, any other error (ValueError included) is a failure
+    except NoDataError as ve:
         logging.warning(f"No data returned for company {companyid}: {ve}")
+        return True
     except Exception as e:
         logging.error(f"❌ Error processing company {companyid}: {e}")
         print(f"⚠️ Skipping company {companyid} due to error: {e}")
         with open(failed_companies_log_second, "a") as f:
             f.write(f"{companyid}\n")
+        return False
     finally:
         logging.info(f"full_batch for company {companyid}")
-        driver.close()
+        if driver is not None:
+            driver.close()
 
 if __name__ == "__main__":
 # SECOND ITERATION
@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from graph_queries import GraphQueries
+
+
+class FakeQueries(GraphQueries):
+    """serves ``hits`` (best first) page by page like db.index.fulltext.queryNodes"""
+
+    def __init__(self, hits):
+        super().__init__(driver=None)
+        self.hits = hits
+        self.pages = []
+
+    def _read(self, query, **params):
+        self.pages.append((params["skip"], params["page"]))
+        return self.hits[params["skip"]:params["skip"] + params["page"]]
+
+
+def statement(c_transcriptcomponentid, year=2020):
+    return {"c_transcriptcomponentid": c_transcriptcomponentid, "text": "safe harbor", "year": year}
+
+
+def test_search_pages_until_enough_statements_are_in_the_period():
+    # only every 50th hit is a statement of 2020
+    hits = [{"score": 1000 - i, "matches": [statement(i)] if i % 50 == 0 else []} for i in range(1000)]
+    queries = FakeQueries(hits)
+
+    statements = queries.search_statements("harbor", year=2020, limit=5)
+
+    assert [s["c_transcriptcomponentid"] for s in statements] == [0, 50, 100, 150, 200]
+    assert queries.pages == [(0, 100), (100, 200)]
+
+
+def test_search_stops_at_max_candidates():
+    hits = [{"score": 1000 - i, "matches": [statement(i)] if i % 50 == 0 else []} for i in range(1000)]
+    queries = FakeQueries(hits)
+
+    statements = queries.search_statements("harbor", year=2020, limit=5, max_candidates=120)
+
+    assert len(statements) == 3
+    assert queries.pages == [(0, 100), (100, 20)]
+
+
+def test_search_returns_a_statement_found_by_name_and_text_once():
+    hits = [
+        {"score": 3.0, "matches": [statement(1)]},
+        {"score": 2.0, "matches": [statement(1), statement(2)]},
+    ]
+
+    statements = FakeQueries(hits).search_statements("harbor", limit=5)
+
+    assert [(s["c_transcriptcomponentid"], s["score"]) for s in statements] == [(1, 3.0), (2, 2.0)]
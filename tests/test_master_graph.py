@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+for module in ("wrds", "neo4j", "psycopg2", "dotenv"):
+    pytest.importorskip(module)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import ecc_company_data as master
+
+
+def test_arranged_chunks_never_split_a_company():
+    eccs = pd.DataFrame({
+        "companyid": [3, 1, 1, 2, 2, 2, 3],
+        "keydevid": [10, 11, 12, 13, 14, 15, 16],
+    })
+
+    jobs = master.partitioned_dataframe_jobs("company-eccs", master.ARRANGED_QUERY, eccs, "companyid", chunk_size=3)
+
+    assert [params["companyid"] for _, _, params in jobs] == [[1, 1], [2, 2, 2], [3, 3]]
+    assert [params["keydevid"] for _, _, params in jobs] == [[11, 12], [13, 14, 15], [10, 16]]
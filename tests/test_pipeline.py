@@ -0,0 +1,165 @@
+import os
+import sys
+import logging
+import importlib
+from pathlib import Path
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+for module in ("wrds", "neo4j", "psycopg2", "dotenv", "more_itertools"):
+    pytest.importorskip(module)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+class FakeContext:
+    def __init__(self, config):
+        self.config = config
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    # statement_participant_data configures a log file on the author's machine when it is imported
+    monkeypatch.setattr(logging, "basicConfig", lambda **kwargs: None)
+    module = importlib.import_module("pipeline")
+    monkeypatch.setattr(module, "PipelineContext", FakeContext)
+    return module
+
+
+@pytest.fixture
+def config(pipeline, tmp_path):
+    return pipeline.PipelineConfig(state_path=str(tmp_path / "logs" / "pipeline_state.json"))
+
+
+@pytest.fixture
+def stages(pipeline, monkeypatch):
+    """two stages, ``b`` depends on ``a``; tests change ``inputs`` and ``results`` between runs"""
+    inputs = {"a": 1, "b": 1}
+    results = {"a": None, "b": None}
+    runs = []
+
+    def stage(name, depends_on=()):
+        def run(ctx, state):
+            runs.append(name)
+            return results[name]
+        return pipeline.Stage(name, lambda ctx: {"value": inputs[name]}, run, outputs=(), depends_on=depends_on)
+
+    monkeypatch.setattr(pipeline, "STAGES", [stage("a"), stage("b", depends_on=("a",))])
+    return inputs, results, runs
+
+
+def test_state_survives_a_reload(pipeline, config):
+    state = pipeline.PipelineState(config.state_path)
+    state.record_stage("a", "fp-a")
+    state.record_company(42, "fp-42")
+
+    reloaded = pipeline.PipelineState(config.state_path)
+
+    assert reloaded.stage("a") == "fp-a"
+    assert reloaded.stage("b") is None
+    assert reloaded.company(42) == "fp-42"
+    assert not os.path.exists(f"{config.state_path}.tmp")
+
+
+def test_stage_fingerprint_follows_inputs_and_upstream(pipeline, config, stages):
+    inputs, _, _ = stages
+    a, b = pipeline.STAGES
+    state = pipeline.PipelineState(config.state_path)
+    ctx = FakeContext(config)
+
+    first = pipeline.stage_fingerprint(b, ctx, state)
+    assert pipeline.stage_fingerprint(b, ctx, state) == first
+
+    state.record_stage("a", "fp-a")
+    after_upstream = pipeline.stage_fingerprint(b, ctx, state)
+    assert after_upstream != first
+
+    inputs["b"] = 2
+    assert pipeline.stage_fingerprint(b, ctx, state) != after_upstream
+
+
+def test_up_to_date_stages_are_skipped(pipeline, config, stages):
+    _, _, runs = stages
+
+    pipeline.run_pipeline(config)
+    pipeline.run_pipeline(config)
+
+    assert runs == ["a", "b"]
+
+
+def test_changed_upstream_reruns_the_downstream_stage(pipeline, config, stages):
+    inputs, _, runs = stages
+    pipeline.run_pipeline(config)
+
+    inputs["a"] = 2
+    pipeline.run_pipeline(config)
+
+    assert runs == ["a", "b", "a", "b"]
+
+
+def test_force_reruns_up_to_date_stages(pipeline, config, stages):
+    _, _, runs = stages
+    pipeline.run_pipeline(config)
+
+    pipeline.run_pipeline(config, only=["b"], force=True)
+
+    assert runs == ["a", "b", "b"]
+
+
+def test_incomplete_stage_stays_stale(pipeline, config, stages):
+    _, results, runs = stages
+    results["b"] = False
+    pipeline.run_pipeline(config)
+
+    results["b"] = None
+    pipeline.run_pipeline(config)
+    pipeline.run_pipeline(config)
+
+    assert runs == ["a", "b", "b"]
+    assert pipeline.PipelineState(config.state_path).stage("b") is not None
+
+
+def test_run_transcripts_only_processes_stale_companies(pipeline, config, monkeypatch):
+    processed = []
+
+    def process_company(row, wrds_db, **kwargs):
+        processed.append(int(row["companyid"]))
+        return row["companyid"] != 3
+
+    monkeypatch.setattr(pipeline.transcripts, "process_company", process_company)
+    state = pipeline.PipelineState(config.state_path)
+    state.record_company(1, "fp-1")
+    state.record_company(2, "old-fp-2")
+
+    ctx = FakeContext(config)
+    ctx.wrds_db = None
+    ctx.company_fingerprints = {1: "fp-1", 2: "fp-2", 3: "fp-3"}
+    ctx.pg_query = lambda query: pd.DataFrame({"companyid": [1, 2, 3], "companyname": ["A", "B", "C"]})
+
+    completed = pipeline.run_transcripts(ctx, state)
+
+    assert processed == [2, 3]
+    assert completed is False
+    # the failed company keeps no fingerprint and is retried on the next run
+    assert state.company(2) == "fp-2"
+    assert state.company(3) is None
+
+
+def test_dry_run_reports_stages_downstream_of_a_stale_stage(pipeline, config, stages, capsys):
+    inputs, _, runs = stages
+    pipeline.run_pipeline(config)
+    recorded = pipeline.PipelineState(config.state_path).state["stages"]
+
+    inputs["a"] = 2
+    pipeline.run_pipeline(config, dry_run=True)
+
+    out = capsys.readouterr().out
+    assert "a: stale" in out
+    assert "b: stale (upstream a is stale)" in out
+    assert runs == ["a", "b"]
+    assert pipeline.PipelineState(config.state_path).state["stages"] == recorded
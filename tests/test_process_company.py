@@ -0,0 +1,170 @@
+import sys
+import logging
+import importlib
+from pathlib import Path
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+for module in ("wrds", "neo4j", "psycopg2", "dotenv", "more_itertools"):
+    pytest.importorskip(module)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+class FakeWRDS:
+    """two ECCs of one transcript each, the CEO speaks and says the same things in both"""
+
+    def __init__(self):
+        self.queries = []
+
+    def raw_sql(self, query):
+        self.queries.append(query)
+        if "GROUP BY keydevid" in query:
+            return pd.DataFrame({
+                "keydevid": [1, 2],
+                "transcripts": [1, 1],
+                "eventdate": ["2020-01-30", "2020-04-30"],
+            })
+
+        keydevid = 1 if "IN (1)" in query else 2
+        return pd.DataFrame({
+            "companyid": [42, 42],
+            "keydevid": [keydevid, keydevid],
+            "transcriptid": [keydevid * 100, keydevid * 100],
+            "c_componentorder": [1, 2],
+            "c_transcriptcomponentid": [keydevid * 10 + 1, keydevid * 10 + 2],
+            "c_transcriptid": [keydevid * 100, keydevid * 100],
+            "c_transcriptpersonid": [7, 7],
+            "transcriptpersonname": ["Jane Doe", "Jane Doe"],
+            "speakertypename": ["Executives", "Executives"],
+            "componenttext": ["Good morning.", "Thank you."],
+            "rn": [1, 1],
+        })
+
+
+class FakeDriver:
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def spd(monkeypatch, tmp_path):
+    # the module configures a log file on the author's machine when it is imported
+    monkeypatch.setattr(logging, "basicConfig", lambda **kwargs: None)
+    module = importlib.import_module("statement_participant_data")
+    monkeypatch.setattr(module, "IMPORT_PATH", str(tmp_path))
+    monkeypatch.setattr(module, "failed_companies_log_second", str(tmp_path / "failed_companies.txt"))
+    monkeypatch.setattr(module, "init_graph_DB", FakeDriver)
+    return module
+
+
+@pytest.fixture
+def uploads(spd, monkeypatch):
+    uploads = []
+
+    def upload_to_neo4j(self):
+        self.load_batch()
+        uploads.append({
+            "statements": len(self.data),
+            "participants_unique": len(self.participants_unique),
+            "texts": len(self.texts),
+        })
+
+    def create_edges(self):
+        self.edge_phases()
+
+    monkeypatch.setattr(spd.Neo4jUploader, "upload_to_neo4j", upload_to_neo4j)
+    monkeypatch.setattr(spd.Neo4jUploader, "create_edges", create_edges)
+    return uploads
+
+
+@pytest.mark.parametrize("text_storage, texts", [("inline", [0, 0]), ("shared", [2, 0])])
+def test_every_window_is_uploaded(spd, uploads, tmp_path, text_storage, texts):
+    row = pd.Series({"companyid": 42, "companyname": "ACME"})
+
+    ok = spd.process_company(row, FakeWRDS(), batch_name="batch_42", window_size=1, text_storage=text_storage)
+
+    assert ok is True
+    # the second window has no participant and no text that was not written by the first one
+    assert uploads == [
+        {"statements": 2, "participants_unique": 1, "texts": texts[0]},
+        {"statements": 2, "participants_unique": 0, "texts": texts[1]},
+    ]
+    assert not (tmp_path / "failed_companies.txt").exists()
+
+
+def test_company_without_transcripts_is_done(spd, uploads, tmp_path):
+    class EmptyWRDS(FakeWRDS):
+        def raw_sql(self, query):
+            return pd.DataFrame({"keydevid": [], "transcripts": [], "eventdate": []})
+
+    row = pd.Series({"companyid": 42, "companyname": "ACME"})
+
+    assert spd.process_company(row, EmptyWRDS(), batch_name="batch_42") is True
+    assert uploads == []
+    assert not (tmp_path / "failed_companies.txt").exists()
+
+
+def test_other_value_errors_fail_the_company(spd, uploads, monkeypatch, tmp_path):
+    def get_wrds_data(self, keydevids=None):
+        raise ValueError("cannot convert to Int64")
+
+    monkeypatch.setattr(spd.WRDSFetcher, "get_wrds_data", get_wrds_data)
+    row = pd.Series({"companyid": 42, "companyname": "ACME"})
+
+    assert spd.process_company(row, FakeWRDS(), batch_name="batch_42") is False
+    assert (tmp_path / "failed_companies.txt").read_text() == "42\n"
+
+
+def test_async_upload_opens_one_driver_per_company(spd, monkeypatch):
+    drivers, engines = [], []
+
+    class FakeAsyncDriver:
+        closed = False
+
+        async def close(self):
+            self.closed = True
+
+    def init_async_graph_DB():
+        drivers.append(FakeAsyncDriver())
+        return drivers[-1]
+
+    async def upload_async(self, engine):
+        self.load_batch()
+        engines.append(engine)
+
+    def init_graph_DB():
+        raise AssertionError("the sync driver is not needed for the async upload")
+
+    monkeypatch.setattr(spd, "init_async_graph_DB", init_async_graph_DB)
+    monkeypatch.setattr(spd, "init_graph_DB", init_graph_DB)
+    monkeypatch.setattr(spd.Neo4jUploader, "upload_async", upload_async)
+    row = pd.Series({"companyid": 42, "companyname": "ACME"})
+
+    ok = spd.process_company(row, FakeWRDS(), batch_name="batch_42", window_size=1, concurrency=4)
+
+    assert ok is True
+    assert len(drivers) == 1 and drivers[0].closed
+    assert len(engines) == 2 and engines[0] is engines[1]
+
+
+def test_edge_chunks_never_split_an_ecc(spd):
+    uploader = spd.Neo4jUploader(None, chunk_size=3)
+    uploader.data = [
+        {"keydevid": keydevid, "c_transcriptcomponentid": keydevid * 10 + order, "c_componentorder": order}
+        for keydevid, statements in ((1, 2), (2, 2), (3, 5))
+        for order in range(statements)
+    ]
+    uploader.participant_data = [
+        {"keydevid": 1, "c_transcriptpersonid": 9},
+        {"keydevid": 1, "c_transcriptpersonid": 7},
+        {"keydevid": 2, "c_transcriptpersonid": 7},
+    ]
+
+    participants, statements, links, pointers = uploader.edge_phases()
+
+    assert [params["keydevid"] for _, _, params in statements] == [[1, 1], [2, 2], [3] * 5]
+    assert [params["from_id"] for _, _, params in links] == [[10, 20], [30, 31, 32, 33]]
+    assert [params["c_transcriptpersonid"] for _, _, params in participants] == [[7, 7, 9]]
+    assert [params["keydevid"] for _, _, params in pointers] == [[1, 2, 3]]